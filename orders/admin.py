@@ -1,7 +1,19 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import F, Sum
+from django.contrib import messages
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from .models import Category, Size, Topping, Extra, Price_List, Item_List, Cart_List, Order, ImageSlider
+from .cards import cards_response
+from .exports import export_response, queryset_rows
+from .models import Category, Size, Topping, Extra, Price_List, Item_List, Cart_List, Order, ImageSlider, Job, DailyRoll, AttendanceArchive, AttendanceMonthly, CategoryDaily, OrphanAttendance
 from django.utils.translation import gettext_lazy as _
+from django.contrib.admin.options import IncorrectLookupParameters
+from datetime import date, timedelta
 
 admin.site.site_header = _("elomda_bus")
 admin.site.site_title = _("elomda Admin")
@@ -17,15 +29,31 @@ class ItemListAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     list_filter = ('category', 'subscription_start_date', 'subscription_end_date')
     readonly_fields = ('qr_code_tag',)
+    actions = ['download_cards_zip', 'download_sheets_png', 'download_sheets_pdf']
 
     def formatted_id(self, obj):
-        return str(obj.id).zfill(4)
+        return obj.formatted_id
     formatted_id.short_description = 'ID'
 
+    def download_cards_zip(self, request, queryset):
+        return cards_response(queryset, 'zip')
+    download_cards_zip.short_description = 'Download QR cards (ZIP)'
+
+    def download_sheets_png(self, request, queryset):
+        return cards_response(queryset, 'png')
+    download_sheets_png.short_description = 'Download printable sheets (PNG pages)'
+
+    def download_sheets_pdf(self, request, queryset):
+        return cards_response(queryset, 'pdf')
+    download_sheets_pdf.short_description = 'Download printable sheets (PDF)'
+
     def qr_code_tag(self, obj):
-        if obj.qr_code:
-            return mark_safe(f'<img src="{obj.qr_code.url}" width="150" height="150" />')
-        return None
+        # مع QR_STORE_FILES الصورة "pending" حتى يُكتب ملف الـ payload الحالي (run_jobs في وضع QR_RENDER_ASYNC)
+        if not obj.id or (getattr(settings, 'QR_STORE_FILES', True) and not obj.qr_is_current(check_file=False)):
+            return 'pending'
+        # صورة بالحجم المعروض فعلاً؛ v يتغير مع محتوى الـ QR فيبقى الكاش صحيحاً
+        url = reverse('qr_code_image', args=[obj.id])
+        return format_html('<img src="{}?size=150&v={}" width="150" height="150" />', url, obj.qr_payload_digest()[:12])
     qr_code_tag.short_description = 'QR Code Preview'
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -118,50 +146,329 @@ from django.utils import timezone
 from django.utils import timezone
 from django.db.models import Q
 
-class AttendanceAdmin(admin.ModelAdmin):
-    list_display = ('user_id', 'name', 'category', 'subscription_start_date', 'subscription_end_date', 'attendance_date', 'attendance_status', 'departure_status')
-    search_fields = ('name', 'user_id')
-    list_filter = ('attendance_date', 'category', 'attendance_status', 'departure_status')
+class RollDayFilter(admin.SimpleListFilter):
+    title = 'day'
+    parameter_name = 'day'
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
+    def lookups(self, request, model_admin):
         today = timezone.now().date()
+        return [(str(today - timedelta(days=n)), str(today - timedelta(days=n))) for n in range(7)]
+
+    def choices(self, changelist):
+        # لا يوجد خيار "الكل": الكشف دائماً ليوم واحد (اليوم افتراضياً)
+        for choice in list(super().choices(changelist))[1:]:
+            yield choice
+
+    def value(self):
+        return super().value() or str(timezone.now().date())
+
+    def queryset(self, request, queryset):
+        try:
+            day = date.fromisoformat(self.value())
+        except ValueError:
+            raise IncorrectLookupParameters('day must be YYYY-MM-DD')
+        return Attendance.roster(day, queryset)
+
+
+def _day_range(start, end=None):
+    start = date.fromisoformat(start)
+    return start, date.fromisoformat(end) if end else start + timedelta(days=1)
+
+
+def _filtered_days(params):
+    """[start, end) from the changelist's attendance_date filter, or None without one."""
+    try:
+        if params.get('attendance_date'):
+            return _day_range(params['attendance_date'])
+        if params.get('attendance_date__gte'):
+            return _day_range(params['attendance_date__gte'], params.get('attendance_date__lt'))
+    except ValueError:
+        pass
+    return None
+
+
+class CategoryFilter(admin.SimpleListFilter):
+    """
+    Categories from the Category table, each labelled with its arrivals for
+    the selected day(s) from CategoryDaily, so the sidebar never reads
+    Attendance. The label says حضور because the number is arrivals, not
+    the rows the list shows.
+    """
+    title = 'الجامعة'
+    parameter_name = 'category'
+    field_path = None
+
+    def days(self, request):
+        """[start, end) of the days being looked at; today if no date filter is set."""
+        return _filtered_days(request.GET) or _day_range(str(timezone.now().date()))
+
+    def lookups(self, request, model_admin):
+        start, end = self.days(request)
+        arrivals = dict(
+            CategoryDaily.objects.filter(day__gte=start, day__lt=end)
+            .values('category_id').annotate(total=Sum('arrivals')).values_list('category_id', 'total')
+        )
+        return [
+            (str(category_id), f"{name} ({arrivals.get(category_id, 0)} حضور)")
+            for category_id, name in Category.objects.order_by('name').values_list('id', 'name')
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            if not self.value().isdigit():
+                raise IncorrectLookupParameters('category must be an ID')
+            return queryset.filter(**{self.field_path: self.value()})
+        return queryset
+
+
+class AttendanceCategoryFilter(CategoryFilter):
+    field_path = 'item__category_id'
+
+
+class RollCategoryFilter(CategoryFilter):
+    field_path = 'category_id'
+
+    def days(self, request):
+        try:
+            return _day_range(request.GET.get('day') or str(timezone.now().date()))
+        except ValueError:
+            return _day_range(str(timezone.now().date()))
+
 
-        # التحقق من أن كل طالب لديه سجل في اليوم الحالي
-        for item in Item_List.objects.all():
-            attendance_record = Attendance.objects.filter(user_id=item.id, attendance_date=today).first()
-
-            # إذا لم يكن هناك سجل، قم بإنشاء سجل جديد بحالة غياب للحضور والانصراف
-            if attendance_record is None:
-                Attendance.objects.create(
-                    user_id=item.id,
-                    name=item.name,
-                    category=item.category.name,
-                    subscription_start_date=item.subscription_start_date,
-                    subscription_end_date=item.subscription_end_date,
-                    attendance_status='غياب',  # تعيين القيمة الافتراضية إلى غياب للحضور
-                    departure_status='غياب',  # تعيين القيمة الافتراضية إلى غياب للانصراف
-                    attendance_date=today
-                )
+class RollStatusFilter(admin.SimpleListFilter):
+    def lookups(self, request, model_admin):
+        return [('1', 'نعم'), ('0', 'غياب')]
 
+    def queryset(self, request, queryset):
+        value = Attendance.DIRECTIONS[self.direction][1]
+        if self.value() == '1':
+            return queryset.filter(**{self.parameter_name: value})
+        if self.value() == '0':
+            return queryset.exclude(**{self.parameter_name: value})
         return queryset
 
+
+class ArrivalFilter(RollStatusFilter):
+    title = 'حالة الحضور'
+    parameter_name = 'attendance_status'
+    direction = 'arrival'
+
+
+class DepartureFilter(RollStatusFilter):
+    title = 'حالة الانصراف'
+    parameter_name = 'departure_status'
+    direction = 'departure'
+
+
+class AttendanceRecordAdmin(admin.ModelAdmin):
+    """Columns, filters and exports shared by the live and the archived attendance tables."""
+    list_display = ('student_id', 'student_name', 'category_name', 'subscription_start_date', 'subscription_end_date', 'attendance_date', 'attendance_status', 'departure_status')
+    list_select_related = ('item__category',)
+    search_fields = ('item__name', '=item__id')
+    list_filter = ('attendance_date', AttendanceCategoryFilter, 'attendance_status', 'departure_status')
+    raw_id_fields = ('item',)
+    actions = ['export_csv', 'export_xlsx']
+
+    def student_id(self, obj):
+        return obj.item.formatted_id
+    student_id.short_description = 'ID'
+    student_id.admin_order_field = 'item_id'
+
+    def student_name(self, obj):
+        return obj.item.name
+    student_name.short_description = 'Name'
+    student_name.admin_order_field = 'item__name'
+
+    def category_name(self, obj):
+        return obj.item.category.name
+    category_name.short_description = 'Category'
+    category_name.admin_order_field = 'item__category__name'
+
+    def subscription_start_date(self, obj):
+        return obj.item.subscription_start_date
+    subscription_start_date.short_description = 'Subscription start date'
+
+    def subscription_end_date(self, obj):
+        return obj.item.subscription_end_date
+    subscription_end_date.short_description = 'Subscription end date'
+
+    def export_csv(self, request, queryset):
+        return export_response(queryset_rows(queryset), 'csv')
+    export_csv.short_description = 'Export selected (CSV)'
+
+    def export_xlsx(self, request, queryset):
+        return export_response(queryset_rows(queryset), 'xlsx')
+    export_xlsx.short_description = 'Export selected (Excel)'
+
+class AttendanceForm(forms.ModelForm):
+
+    class Meta:
+        model = Attendance
+        fields = '__all__'
+
+    def clean_attendance_date(self):
+        # الأيام المؤرشفة تُقرأ من AttendanceArchive فقط؛ صف جديد لها لن يظهر في الكشف
+        day = self.cleaned_data['attendance_date']
+        archived = Attendance.archived_through()
+        if archived and day <= archived:
+            raise forms.ValidationError(f'الأيام حتى {archived} مؤرشفة ولا يمكن تسجيلها هنا.')
+        return day
+
+class AttendanceAdmin(AttendanceRecordAdmin):
+    form = AttendanceForm
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            obj.count_in_rollups(-1)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        # حذف يدوي يُطرح من الملخصات؛ النقل إلى الأرشيف (archive_before) لا يمر من هنا
+        with transaction.atomic():
+            for record in queryset:
+                record.count_in_rollups(-1)
+            super().delete_queryset(request, queryset)
+
+    def get_urls(self):
+        return [
+            path('summary/', self.admin_site.admin_view(self.summary_view), name='orders_attendance_summary'),
+        ] + super().get_urls()
+
+    def summary_view(self, request):
+        """Totals per student for ``?month=YYYY-MM`` (default this month), read from the rollup tables."""
+        today = timezone.now().date()
+        try:
+            month = date.fromisoformat(request.GET['month'] + '-01') if request.GET.get('month') else today.replace(day=1)
+        except ValueError:
+            month = today.replace(day=1)
+        summary = (
+            AttendanceMonthly.objects.filter(month=month)
+            .order_by('item__name')
+            .values(name=F('item__name'), total_attendance=F('arrivals'), total_leave=F('departures'))
+        )
+        categories = (
+            CategoryDaily.objects.filter(day=today)
+            .order_by('category__name')
+            .values('arrivals', 'departures', name=F('category__name'))
+        )
+        previous = (month - timedelta(days=1)).replace(day=1)
+        following = (month + timedelta(days=31)).replace(day=1)
+        return render(request, 'admin/attendance_summary.html', {
+            **self.admin_site.each_context(request),
+            'title': 'ملخص الحضور والانصراف',
+            'opts': self.model._meta,
+            'attendance_summary': summary,
+            'category_summary': categories,
+            'month': month,
+            'previous_month': previous.strftime('%Y-%m'),
+            'next_month': following.strftime('%Y-%m'),
+            'today': today,
+        })
+
+    def changelist_view(self, request, extra_context=None):
+        archived = Attendance.archived_through()
+        days = _filtered_days(request.GET)
+        if archived and days and days[0] <= archived:
+            archive_url = reverse('admin:orders_attendancearchive_changelist') + '?' + request.GET.urlencode()
+            if days[1] - timedelta(days=1) <= archived:
+                # كل الأيام المطلوبة في الأرشيف
+                return redirect(archive_url)
+            # القائمة تعرض جدولاً واحداً؛ التصدير بمدى تواريخ يجمع الجدولين
+            messages.info(request, format_html(
+                'الأيام حتى {} موجودة في <a href="{}">الأرشيف</a>. <a href="{}">تصدير المدى كاملاً</a>.',
+                archived, archive_url, reverse('attendance_export') + f'?from={days[0]}&to={days[1] - timedelta(days=1)}',
+            ))
+        # كشف اليوم يُبنى مرة واحدة (أو من build_attendance_roll في cron) وليس مع كل استعلام
+        Attendance.ensure_roll()
+        return super().changelist_view(request, extra_context=extra_context)
+
     def save_model(self, request, obj, form, change):
-        # البحث عن السجل الموجود في اليوم الحالي
-        attendance_record = Attendance.objects.filter(user_id=obj.user_id, attendance_date=obj.attendance_date).first()
-
-        # إذا كان السجل موجودًا، قم بتحديث حالة الحضور أو الانصراف
-        if attendance_record:
-            if obj.attendance_status == 'حضور':
-                attendance_record.attendance_status = 'حضور'
-            if obj.departure_status == 'انصراف':
-                attendance_record.departure_status = 'انصراف'
-            attendance_record.save()  # حفظ التعديلات
-        else:
-            # إذا لم يكن هناك سجل، قم بحفظ السجل الجديد
-            super().save_model(request, obj, form, change)
+        if change:
+            # تعديل يدوي: نطرح العلامات القديمة من جداول الملخص ونضيف الجديدة
+            with transaction.atomic():
+                Attendance.objects.get(pk=obj.pk).count_in_rollups(-1)
+                super().save_model(request, obj, form, change)
+                obj.count_in_rollups(1)
+            return
+        # إضافة يدوية: نفس مسار الماسح حتى لا يتكرر الصف إذا سجله الماسح في نفس اللحظة
+        for direction, (field, value) in Attendance.DIRECTIONS.items():
+            if getattr(obj, field) == value:
+                Attendance.mark(obj.item_id, direction, obj.attendance_date)
+        obj.pk = Attendance.objects.get_or_create(item_id=obj.item_id, attendance_date=obj.attendance_date)[0].pk
+
+class AttendanceArchiveAdmin(AttendanceRecordAdmin):
+    """Read-only view of the months moved out by ``manage.py archive_attendance``."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class OrphanAttendanceAdmin(admin.ModelAdmin):
+    """Read-only rows of deleted students, kept by migration 0090."""
+    list_display = ('user_id', 'name', 'category', 'attendance_date', 'attendance_status', 'departure_status')
+    list_filter = ('attendance_date',)
+    search_fields = ('name', '=user_id')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class DailyRollAdmin(admin.ModelAdmin):
+    """Every expected student for a day, absent ones included, in either storage mode."""
+    list_display = ('formatted_id', 'name', 'category', 'arrival', 'departure')
+    list_select_related = ('category',)
+    list_filter = (RollDayFilter, ArrivalFilter, DepartureFilter, RollCategoryFilter)
+    search_fields = ('name', '=id')
+    list_display_links = None
+
+    def formatted_id(self, obj):
+        return obj.formatted_id
+    formatted_id.short_description = 'ID'
+
+    def arrival(self, obj):
+        return dict(Attendance.ATTENDANCE_CHOICES)[obj.attendance_status]
+    arrival.short_description = 'حالة الحضور'
+
+    def departure(self, obj):
+        return dict(Attendance.ATTENDANCE_CHOICES)[obj.departure_status]
+    departure.short_description = 'حالة الانصراف'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'key', 'status', 'attempts', 'run_after', 'updated')
+    list_filter = ('status', 'kind')
+    search_fields = ('key',)
+    readonly_fields = ('last_error',)
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(status=Job.PENDING, run_after=timezone.now())
+        self.message_user(request, f"{updated} job(s) queued again.")
+    retry_jobs.short_description = 'Retry selected jobs'
 
 admin.site.register(Attendance, AttendanceAdmin)
+admin.site.register(AttendanceArchive, AttendanceArchiveAdmin)
+admin.site.register(OrphanAttendance, OrphanAttendanceAdmin)
+admin.site.register(DailyRoll, DailyRollAdmin)
+admin.site.register(Job, JobAdmin)
 admin.site.register(Item_List, ItemListAdmin)
 admin.site.register(Category, CategoryAdmin)
 
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class OrdersConfig(AppConfig):
     name = 'orders'
+
+    def ready(self):
+        from django.core import checks
+        from . import signals, tasks  # noqa: F401
+        from .cards import check_card_font
+        checks.register(check_card_font)
@@ -0,0 +1,47 @@
+"""Synthetic camera frames for the scan benchmarks (bench_scan, bench_grayscale)."""
+from io import BytesIO
+import base64
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from .qr import make_qr
+
+
+def synthetic_frame(size, data, code_fraction=0.4, rotation=0, blur=0, noise=0, seed=0):
+    """
+    An RGB frame of ``size`` showing a QR code for ``data``.
+
+    The code is rendered with the same qrcode settings as the cards. It is
+    scaled to ``code_fraction`` of the short side, rotated by ``rotation``
+    degrees and placed on a gradient background. The frame then gets a
+    Gaussian blur of radius ``blur`` and Gaussian noise with standard
+    deviation ``noise``. The seeded noise keeps runs comparable.
+    """
+    code = make_qr(data).make_image(fill='black', back_color='white').get_image().convert('L')
+    side = max(1, int(min(size) * code_fraction))
+    code = code.resize((side, side), Image.NEAREST)
+    if rotation:
+        code = code.rotate(rotation, resample=Image.BILINEAR, expand=True, fillcolor=255)
+
+    frame = Image.linear_gradient('L').resize(size).point(lambda v: 60 + v // 2)
+    frame.paste(code, ((size[0] - code.width) // 2, (size[1] - code.height) // 2))
+    frame = frame.convert('RGB')
+    if blur:
+        frame = frame.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = np.asarray(frame, dtype=np.int16)
+        pixels = pixels + np.random.default_rng(seed).normal(0, noise, pixels.shape).astype(np.int16)
+        frame = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return frame
+
+
+def encode_frame(image, image_format='PNG'):
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def data_url(frame_bytes, image_format='PNG'):
+    """What canvas.toDataURL() posts to scan_qr."""
+    return f"data:image/{image_format.lower()};base64," + base64.b64encode(frame_bytes).decode('ascii')
@@ -0,0 +1,276 @@
+"""
+Printable student cards: a QR code with the name and zero-padded ID underneath.
+
+Everything here is a generator, so a batch of thousands of cards is streamed
+to the client one card (or one page) at a time:
+
+* ``stream_card_zip``  - a ZIP with one PNG per card
+* ``stream_sheet_zip`` - a ZIP of A4 PNG pages, ``CARDS_PER_PAGE`` cards each
+* ``stream_sheet_pdf`` - the same pages as a PDF
+
+Names are drawn with ``settings.QR_CARD_FONT`` (a .ttf path), or with the
+bundled DejaVu Sans, which has Arabic glyphs. Arabic needs shaping: Pillow's
+raqm layout when it is built with it, otherwise arabic_reshaper + python-bidi.
+``check_card_font`` (a system check) stops the server at startup when the font
+or the shaping is missing, instead of printing cards full of empty boxes.
+"""
+from functools import lru_cache
+from io import BytesIO
+import os
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.core import checks
+from django.http import StreamingHttpResponse
+from PIL import Image, ImageDraw, ImageFont, features
+
+from .qr import encode_payload, make_qr
+
+try:
+    import arabic_reshaper
+    from arabic_reshaper.ligatures import LIGATURES
+    from bidi.algorithm import get_display
+except ImportError:
+    arabic_reshaper = None
+
+DEFAULT_FONT = os.path.join(os.path.dirname(__file__), 'fonts', 'DejaVuSans.ttf')
+
+# A4 بدقة 150 نقطة لكل بوصة
+PAGE_SIZE = (1240, 1754)
+PAGE_POINTS = (595, 842)
+COLUMNS, ROWS = 3, 4
+CARDS_PER_PAGE = COLUMNS * ROWS
+CARD_SIZE = (400, 430)
+QR_SCALE = 10
+NAME_SIZE, MIN_NAME_SIZE = 28, 16
+NAME_MARGIN = 10
+
+
+def card_rows(queryset):
+    """The items of ``queryset`` with only what a card needs, fetched in chunks."""
+    return (
+        queryset.order_by('category__name', 'id')
+        .only('id', 'name', 'subscription_end_date')
+        .iterator(chunk_size=500)
+    )
+
+
+def _font_path():
+    return getattr(settings, 'QR_CARD_FONT', None) or DEFAULT_FONT
+
+
+def _font():
+    return ImageFont.truetype(_font_path(), NAME_SIZE)
+
+
+def _has_glyphs(font, text):
+    # حرف غير موجود في الخط يُرسم كمربع notdef
+    notdef = bytes(font.getmask('\ue000'))
+    return all(bytes(font.getmask(letter)) != notdef for letter in text)
+
+
+@lru_cache(maxsize=4)
+def _reshaper(font_path):
+    """A reshaper that only joins into ligatures ``font_path`` has glyphs for (e.g. no ﷲ in DejaVu)."""
+    font = ImageFont.truetype(font_path, NAME_SIZE)
+    return arabic_reshaper.ArabicReshaper(configuration={
+        name: _has_glyphs(font, ''.join(forms)) for name, (_, forms) in LIGATURES
+    })
+
+
+def shape(text):
+    """``text`` ready for draw.text: joined Arabic letters in visual (right-to-left) order."""
+    if features.check('raqm') or arabic_reshaper is None:
+        # raqm يشكل الحروف ويرتبها بنفسه
+        return text
+    return get_display(_reshaper(_font_path()).reshape(text))
+
+
+def check_card_font(app_configs, **kwargs):
+    try:
+        font = _font()
+    except OSError as e:
+        return [checks.Error(f"QR card font cannot be loaded: {e}", hint="Set QR_CARD_FONT to a .ttf file.", id='orders.E001')]
+    errors = []
+    if not _has_glyphs(font, 'احمد\ufe8d\ufea3\ufefb'):
+        errors.append(checks.Error(
+            "QR card font has no Arabic glyphs; Arabic names would print as boxes.",
+            hint="Set QR_CARD_FONT to a font with Arabic and Arabic presentation forms, or leave it unset.",
+            id='orders.E002',
+        ))
+    if not features.check('raqm') and arabic_reshaper is None:
+        errors.append(checks.Error(
+            "Arabic names cannot be shaped: Pillow has no raqm and arabic_reshaper/python-bidi are not installed.",
+            hint="pip install arabic-reshaper python-bidi",
+            id='orders.E003',
+        ))
+    return errors
+
+
+def fit_name(draw, name, font, width=CARD_SIZE[0] - 2 * NAME_MARGIN):
+    """The shaped ``name`` and a font that fit in ``width``: a smaller size first, then a cut with an ellipsis."""
+    size = font.size
+    while True:
+        text = shape(name)
+        if draw.textlength(text, font=font) <= width:
+            return text, font
+        if size > MIN_NAME_SIZE:
+            size -= 2
+            font = font.font_variant(size=max(size, MIN_NAME_SIZE))
+            continue
+        # نقص الاسم قبل التشكيل حتى تبقى الحروف العربية موصولة بشكل صحيح
+        name = name.rstrip('\u2026')[:-1].rstrip() + '\u2026'
+
+
+def render_card(item, font=None):
+    font = font or _font()
+    card = Image.new('L', CARD_SIZE, 255)
+    matrix = make_qr(encode_payload(item.id, item.subscription_end_date)).get_matrix()
+    modules = len(matrix)
+    code = Image.new('L', (modules, modules), 255)
+    code.putdata([0 if cell else 255 for row in matrix for cell in row])
+    code = code.resize((modules * QR_SCALE, modules * QR_SCALE), Image.NEAREST)
+    card.paste(code, ((CARD_SIZE[0] - code.width) // 2, 0))
+
+    draw = ImageDraw.Draw(card)
+    center = CARD_SIZE[0] // 2
+    name, name_font = fit_name(draw, item.name, font)
+    draw.text((center, code.height + 10), name, fill=0, font=name_font, anchor='mt')
+    draw.text((center, code.height + 50), item.formatted_id, fill=0, font=font, anchor='mt')
+    return card
+
+
+def _png(image):
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _cards(rows):
+    font = _font()
+    for item in rows:
+        yield item, render_card(item, font)
+
+
+def _pages(rows):
+    page, count = None, 0
+    margin_x = (PAGE_SIZE[0] - COLUMNS * CARD_SIZE[0]) // 2
+    margin_y = (PAGE_SIZE[1] - ROWS * CARD_SIZE[1]) // 2
+    for _, card in _cards(rows):
+        if page is None:
+            page = Image.new('L', PAGE_SIZE, 255)
+        row, column = divmod(count, COLUMNS)
+        page.paste(card, (margin_x + column * CARD_SIZE[0], margin_y + row * CARD_SIZE[1]))
+        count += 1
+        if count == CARDS_PER_PAGE:
+            yield page
+            page, count = None, 0
+    if page is not None:
+        yield page
+
+
+class StreamBuffer:
+    """A write-only file for zipfile: whatever was written is taken out with ``drain()``."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _stream_zip(files):
+    # zipfile يكتب data descriptors عندما لا يمكن الرجوع في الملف، فلا نحتاج الأرشيف كاملاً في الذاكرة
+    out = StreamBuffer()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+            yield out.drain()
+    yield out.drain()
+
+
+def stream_card_zip(rows):
+    return _stream_zip((f"{item.formatted_id}.png", _png(card)) for item, card in _cards(rows))
+
+
+def stream_sheet_zip(rows):
+    return _stream_zip((f"page_{number:03}.png", _png(page)) for number, page in enumerate(_pages(rows), 1))
+
+
+def stream_sheet_pdf(rows):
+    """
+    A PDF written page by page. Each page is one grayscale image; the Pages
+    object is written last because the page count is only known at the end.
+    """
+    offsets = {}
+    position = 0
+
+    def emit(number, body, stream=None):
+        nonlocal position
+        offsets[number] = position
+        data = f"{number} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        data += b"\nendobj\n"
+        position += len(data)
+        return data
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    pages = []
+    width, height = PAGE_SIZE
+    for page in _pages(rows):
+        number = 3 + 3 * len(pages)
+        image = zlib.compress(page.tobytes(), 6)
+        yield emit(number, (
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(image)} >>"
+        ).encode(), image)
+        content = f"q {PAGE_POINTS[0]} 0 0 {PAGE_POINTS[1]} 0 0 cm /Im0 Do Q".encode()
+        yield emit(number + 1, f"<< /Length {len(content)} >>".encode(), content)
+        yield emit(number + 2, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_POINTS[0]} {PAGE_POINTS[1]}] "
+            f"/Resources << /XObject << /Im0 {number} 0 R >> >> /Contents {number + 1} 0 R >>"
+        ).encode())
+        pages.append(number + 2)
+
+    kids = ' '.join(f"{number} 0 R" for number in pages)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+
+    size = max(offsets) + 1
+    xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[number]:010} 00000 n \n" for number in range(1, size)]
+    xref.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n")
+    yield ''.join(xref).encode()
+
+
+CARD_OUTPUTS = {
+    'zip': (stream_card_zip, 'application/zip', 'qr_cards.zip'),
+    'png': (stream_sheet_zip, 'application/zip', 'qr_sheets.zip'),
+    'pdf': (stream_sheet_pdf, 'application/pdf', 'qr_sheets.pdf'),
+}
+
+
+def cards_response(queryset, output):
+    stream, content_type, filename = CARD_OUTPUTS[output]
+    response = StreamingHttpResponse(stream(card_rows(queryset)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,203 @@
+"""
+QR decoding in a pool of warm worker processes.
+
+zbar decoding is CPU bound, so running it in the request thread lets a few
+busy gates starve cheap requests such as scan_qr_by_id. Frames are reduced
+to 8-bit grayscale in the request process, then handed to worker processes
+that import pyzbar and run one decode at start-up. Workers are started as
+soon as a pool is created, not on its first frame.
+
+The queue is bounded: when every worker is busy and ``QR_DECODE_QUEUE_SIZE``
+frames are already waiting, ``decode`` raises ``PoolBusy`` immediately
+instead of queueing more work. Each frame gets ``QR_DECODE_TIMEOUT`` seconds.
+Workers skip the remaining attempts once that deadline passes, and the
+request stops waiting for the result at the same moment. A worker still
+busy with the frame at that point (e.g. a zbar call that never returns)
+is killed together with the rest of its pool, and a fresh pool takes over,
+so a stuck decode cannot hold a slot forever. Other frames in flight on
+the killed pool fail with ``DecodeTimeout`` and are retried by the client.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import multiprocessing
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from .scanning import DecodeStrategy, to_luminance
+
+
+class PoolBusy(Exception):
+    def __init__(self, retry_after, stats):
+        super().__init__('QR decode queue is full.')
+        self.retry_after = retry_after
+        self.stats = stats
+
+
+class DecodeTimeout(Exception):
+    def __init__(self, stats):
+        super().__init__('QR decode took too long.')
+        self.stats = stats
+
+
+_worker_strategy = None
+
+
+def _init_worker(attempts):
+    global _worker_strategy
+    _worker_strategy = DecodeStrategy(attempts)
+    # أول decode يحمّل libzbar ويجهز الـ scanner قبل وصول أول طلب حقيقي
+    _worker_strategy.decode(Image.new('L', (64, 64), 255))
+
+
+def _warm_up():
+    return None
+
+
+def _decode_in_worker(size, pixels, deadline):
+    started = time.time()
+    image = Image.frombytes('L', size, pixels)
+    return _worker_strategy.decode(image, deadline=deadline), started
+
+
+class DecodePool:
+    def __init__(self, workers, queue_size, timeout, retry_after=1, attempts=None, start_method='spawn'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.attempts = tuple(attempts or DecodeStrategy().attempts)
+        self.start_method = start_method
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._last_wait_ms = 0.0
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=(self.attempts,),
+        )
+        # ProcessPoolExecutor يبدأ العمال عند أول مهمة؛ مهمة فارغة لكل عامل تبدأهم الآن
+        # فلا يدفع أول مسح (بعد التشغيل أو بعد _replace) ثمن تشغيل العملية و _init_worker
+        for _ in range(self.workers):
+            executor.submit(_warm_up)
+        return executor
+
+    def _submit(self, *args):
+        """Return (executor, future) so a timeout can replace the executor the frame went to."""
+        executor = self._executor
+        try:
+            return executor, executor.submit(_decode_in_worker, *args)
+        except BrokenProcessPool:
+            # عامل مات (مثلاً crash داخل zbar): نبدأ pool جديد مرة واحدة
+            executor = self._replace(executor)
+            return executor, executor.submit(_decode_in_worker, *args)
+
+    def _replace(self, executor):
+        """Put a fresh pool in place of ``executor`` and kill its workers; return the new pool."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = self._new_executor()
+            replacement = self._executor
+        # ProcessPoolExecutor لا يوقف مهمة قيد التشغيل، فنوقف العمليات نفسها
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return replacement
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queue_depth': self._depth,
+                'last_wait_ms': round(self._last_wait_ms, 1),
+            }
+
+    def _release(self, future):
+        with self._lock:
+            self._depth -= 1
+        self._slots.release()
+
+    def decode(self, image):
+        """Return (DecodeResult, {'queue_depth': ..., 'queue_wait_ms': ...})."""
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy(self.retry_after, self.stats())
+        with self._lock:
+            depth = self._depth
+            self._depth += 1
+
+        try:
+            gray = to_luminance(image)
+            submitted = time.time()
+            executor, future = self._submit(gray.size, gray.tobytes(), submitted + self.timeout)
+        except BaseException:
+            self._release(None)
+            raise
+        # الـ slot يبقى محجوزاً حتى ينتهي العامل فعلاً، حتى لو انتهت مهلة الطلب
+        future.add_done_callback(self._release)
+
+        try:
+            result, started = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if not future.cancel() and not future.done():
+                # العامل ما زال يفك هذا الإطار بعد المهلة: غالباً zbar عالق
+                self._replace(executor)
+            raise DecodeTimeout(self.stats())
+        except BrokenProcessPool:
+            raise DecodeTimeout(self.stats())
+
+        wait_ms = max(0.0, (started - submitted) * 1000)
+        with self._lock:
+            self._last_wait_ms = wait_ms
+        return result, {'queue_depth': depth, 'queue_wait_ms': round(wait_ms, 1)}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InlineDecoder:
+    """QR_DECODE_WORKERS = 0: decode in the request thread, as before the pool existed."""
+    workers = 0
+    queue_size = 0
+
+    def __init__(self, attempts=None):
+        self.strategy = DecodeStrategy(attempts)
+
+    def stats(self):
+        return {'workers': 0, 'queue_size': 0, 'queue_depth': 0, 'last_wait_ms': 0.0}
+
+    def decode(self, image):
+        return self.strategy.decode(image), {'queue_depth': 0, 'queue_wait_ms': 0.0}
+
+    def shutdown(self):
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, 'QR_DECODE_WORKERS', 2)
+            if workers:
+                _pool = DecodePool(
+                    workers=workers,
+                    queue_size=getattr(settings, 'QR_DECODE_QUEUE_SIZE', 8),
+                    timeout=getattr(settings, 'QR_DECODE_TIMEOUT', 2.0),
+                    retry_after=getattr(settings, 'QR_DECODE_RETRY_AFTER', 1),
+                )
+            else:
+                _pool = InlineDecoder()
+            atexit.register(_pool.shutdown)
+        return _pool
@@ -0,0 +1,185 @@
+"""
+Attendance exports streamed as CSV or XLSX.
+
+Rows are read with ``.iterator(chunk_size=...)`` and written out as they
+arrive, so memory stays flat for any date range and the header goes out
+before the first query runs. Date-range exports give the rows
+``Attendance.roster`` gives for each day, whether or not ATTENDANCE_SPARSE
+is on, from three queries for the whole range rather than one per day.
+"""
+from datetime import timedelta
+from itertools import groupby
+from xml.sax.saxutils import escape
+import csv
+import zipfile
+
+from django.http import StreamingHttpResponse
+
+from .cards import StreamBuffer
+from .models import Attendance, AttendanceArchive, Item_List
+
+CHUNK_SIZE = 2000
+HEADER = ['ID', 'الاسم', 'الجامعة', 'التاريخ', 'حالة الحضور', 'حالة الانصراف']
+STATUS_LABELS = dict(Attendance.ATTENDANCE_CHOICES)
+
+
+def _range_marks(date_from, date_to, category_id=None):
+    """``(day, rows)`` per marked day in the range, archived days first, read in date order."""
+    archived = Attendance.archived_through()
+    parts = [(Attendance, date_from, date_to)]
+    if archived and archived >= date_from:
+        # نفس تقسيم Attendance.roster: الأيام حتى archived_through تُقرأ من الأرشيف
+        parts = [(AttendanceArchive, date_from, min(archived, date_to)), (Attendance, archived + timedelta(days=1), date_to)]
+    for model, start, end in parts:
+        if start > end:
+            continue
+        marks = model.objects.filter(attendance_date__gte=start, attendance_date__lte=end)
+        if category_id:
+            marks = marks.filter(item__category_id=category_id)
+        rows = (
+            marks.order_by('attendance_date')
+            .values_list('attendance_date', 'item_id', 'item__name', 'item__category__name', 'attendance_status', 'departure_status')
+            .iterator(chunk_size=CHUNK_SIZE)
+        )
+        yield from groupby(rows, key=lambda row: row[0])
+
+
+def _wanted(status, value, flag):
+    return flag is None or (status == value) is flag
+
+
+def roster_rows(date_from, date_to, category_id=None, arrival=None, departure=None):
+    """Export rows for every expected student on each day in the range.
+
+    A student is on a day's list when subscribed that day or marked that
+    day, and counts as absent without a row, as in ``Attendance.roster``.
+    ``arrival`` / ``departure``: True = marked only, False = not marked only, None = both.
+    """
+    students = Item_List.objects.filter(Item_List.subscribed_between(date_from, date_to))
+    if category_id:
+        students = students.filter(category_id=category_id)
+    students = sorted(
+        students.values_list('id', 'name', 'category__name', 'subscription_start_date', 'subscription_end_date'),
+        key=lambda student: (student[2], student[0]),
+    )
+    absent = (Attendance.ABSENT, Attendance.ABSENT)
+    marked_days = _range_marks(date_from, date_to, category_id)
+    next_day, next_marks = next(marked_days, (None, ()))
+    day = date_from
+    while day <= date_to:
+        # item_id -> (name, category, attendance_status, departure_status)
+        marks = {}
+        if day == next_day:
+            marks = {row[1]: row[2:] for row in next_marks}
+            next_day, next_marks = next(marked_days, (None, ()))
+        rows = [
+            (item_id, name, category) for item_id, name, category, start, end in students
+            if (start is None or start <= day) and (end is None or end >= day)
+        ]
+        expected = {row[0] for row in rows}
+        extra = [(item_id, *mark[:2]) for item_id, mark in marks.items() if item_id not in expected]
+        if extra:
+            rows = sorted(rows + extra, key=lambda row: (row[2], row[0]))
+        for item_id, name, category in rows:
+            arrived, departed = marks[item_id][2:] if item_id in marks else absent
+            if _wanted(arrived, Attendance.PRESENT, arrival) and _wanted(departed, Attendance.DEPARTED, departure):
+                yield item_id, name, category, day, arrived, departed
+        day += timedelta(days=1)
+
+
+def queryset_rows(queryset):
+    """Export rows for a queryset of Attendance records (e.g. an admin selection)."""
+    return (
+        queryset.order_by('attendance_date', 'item_id')
+        .values_list('item_id', 'item__name', 'item__category__name', 'attendance_date', 'attendance_status', 'departure_status')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def _cells(row):
+    item_id, name, category, day, arrived, departed = row
+    return [str(item_id).zfill(4), name, category, day.isoformat(), STATUS_LABELS[arrived], STATUS_LABELS[departed]]
+
+
+class Echo:
+    """csv.writer target that hands each line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    # BOM حتى يفتح Excel الأسماء العربية بشكل صحيح
+    yield '\ufeff' + writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow(_cells(row))
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Attendance" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(cells):
+    return '<row>' + ''.join(f'<c t="inlineStr"><is><t>{escape(cell)}</t></is></c>' for cell in cells) + '</row>'
+
+
+def stream_xlsx(rows):
+    # ملف XLSX هو zip؛ ورقة البيانات تُكتب داخل الأرشيف صفاً بصف بدل تجهيزها كاملة
+    out = StreamBuffer()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield out.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(HEADER)
+            ).encode())
+            for number, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(_cells(row)).encode())
+                if number % CHUNK_SIZE == 0:
+                    yield out.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield out.drain()
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8', 'attendance.csv'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'attendance.xlsx'),
+}
+
+
+def export_response(rows, export_format):
+    stream, content_type, filename = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,119 @@
+"""
+Read-through cache from item ID to the JSON a scan returns.
+
+Every scan used to run two queries (the item, then its category) and build
+the same dict again. Entries are filled with one select_related query and
+dropped by the post_save/post_delete handlers in orders.signals. Writes made
+with QuerySet.update() skip those signals and must call ``invalidate``.
+
+The backend is chosen by ``settings.ITEM_CACHE``. ``LRUBackend`` is a bounded
+per-process LRU. ``DjangoCacheBackend`` stores entries in one of the CACHES
+aliases, so several workers share it and see the same invalidations.
+"""
+from collections import OrderedDict
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import Http404
+from django.utils.module_loading import import_string
+
+from .models import Item_List
+
+
+class LRUBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, item_id):
+        with self._lock:
+            data = self._entries.get(item_id)
+            if data is not None:
+                self._entries.move_to_end(item_id)
+            return data
+
+    def set(self, item_id, data):
+        with self._lock:
+            self._entries[item_id] = data
+            self._entries.move_to_end(item_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, item_ids):
+        with self._lock:
+            for item_id in item_ids:
+                self._entries.pop(item_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias='default', timeout=None, key_prefix='orders:item:'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, item_id):
+        return self.cache.get(f"{self.key_prefix}{item_id}")
+
+    def set(self, item_id, data):
+        self.cache.set(f"{self.key_prefix}{item_id}", data, self.timeout)
+
+    def delete_many(self, item_ids):
+        self.cache.delete_many([f"{self.key_prefix}{item_id}" for item_id in item_ids])
+
+    def clear(self):
+        self.cache.clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            config = getattr(settings, 'ITEM_CACHE', {})
+            backend_class = import_string(config.get('BACKEND', 'orders.item_cache.LRUBackend'))
+            _backend = backend_class(**config.get('OPTIONS', {}))
+        return _backend
+
+
+def serialize_item(item):
+    return {
+        'id': item.id,
+        'name': item.name,
+        'category': item.category.name,
+        'category_id': item.category_id,
+        'subscription_start_date': item.subscription_start_date,
+        'subscription_end_date': item.subscription_end_date,
+        'image_url': item.image.url if item.image else None
+    }
+
+
+def get_item_data(item_id):
+    """Return the scan response dict for ``item_id``, or raise Http404."""
+    item_id = int(item_id)
+    backend = get_backend()
+    data = backend.get(item_id)
+    if data is None:
+        item = Item_List.objects.select_related('category').filter(id=item_id).first()
+        if item is None:
+            raise Http404('Item not found')
+        data = serialize_item(item)
+        backend.set(item_id, data)
+    return dict(data)
+
+
+def invalidate(*item_ids):
+    if item_ids:
+        get_backend().delete_many([int(item_id) for item_id in item_ids])
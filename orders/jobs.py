@@ -0,0 +1,75 @@
+"""
+A small job queue stored in the database, so no external broker is needed.
+
+Handlers are registered with ``@job('kind')`` (see orders.tasks) and queued
+with ``enqueue('kind', key=..., **payload)``. The Job row is written in the
+caller's transaction, so a rolled-back save never leaves a job behind.
+``manage.py run_jobs`` claims pending rows one at a time with a conditional
+UPDATE, which lets several workers share the table safely. Failed jobs are
+retried with a growing delay until ``JOB_MAX_ATTEMPTS``.
+"""
+from datetime import timedelta
+import traceback
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+_handlers = {}
+
+
+def job(kind):
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, key='', **payload):
+    if key and Job.objects.filter(kind=kind, key=key, status=Job.PENDING).exists():
+        return None
+    return Job.objects.create(kind=kind, key=key, payload=payload)
+
+
+def claim_next():
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status=Job.PENDING, run_after__lte=now)
+        .order_by('id').values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(id=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING, attempts=F('attempts') + 1, updated=now,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind {job.kind!r}")
+        handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < getattr(settings, 'JOB_MAX_ATTEMPTS', 5):
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=30 * 2 ** job.attempts)
+        else:
+            job.status = Job.FAILED
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+    job.save(update_fields=['status', 'run_after', 'last_error', 'updated'])
+    return job
+
+
+def requeue_stale(older_than=timedelta(minutes=10)):
+    """Jobs left 'running' by a worker that died go back to the queue."""
+    return Job.objects.filter(status=Job.RUNNING, updated__lt=timezone.now() - older_than).update(
+        status=Job.PENDING, updated=timezone.now(),
+    )
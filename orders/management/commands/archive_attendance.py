@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import Attendance, SyncedMark
+
+
+def default_cutoff(today=None):
+    """First day of the month ATTENDANCE_HOT_MONTHS months before this one."""
+    today = today or timezone.now().date()
+    months = today.year * 12 + today.month - 1 - getattr(settings, 'ATTENDANCE_HOT_MONTHS', 4)
+    return date(months // 12, months % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = "Move old attendance rows into the archive table. Safe to run from cron (e.g. monthly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=date.fromisoformat,
+                            help="Archive days before this date (YYYY-MM-DD), default keeps ATTENDANCE_HOT_MONTHS months.")
+
+    def handle(self, *args, **options):
+        cutoff = options['before'] or default_cutoff()
+        moved = Attendance.archive_before(cutoff)
+        # مفاتيح المزامنة تلزم فقط لإعادة إرسال قريبة
+        forgotten, _ = SyncedMark.objects.filter(marked_at__date__lt=cutoff).delete()
+        self.stdout.write(f"before {cutoff}: {moved} attendance rows archived, {forgotten} sync keys removed")
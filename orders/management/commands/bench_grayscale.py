@@ -0,0 +1,117 @@
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+from pyzbar import pyzbar
+
+from orders.bench import encode_frame, synthetic_frame
+from orders.scanning import to_luminance
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+def legacy_luminance(image):
+    # المسار القديم في scan_qr: مصفوفة float64 ثم نسخة uint8
+    image_np = np.array(image)
+    return np.dot(image_np[..., :3], [0.2989, 0.5870, 0.1140]).astype(np.uint8)
+
+
+PIPELINES = {
+    'before': legacy_luminance,
+    'after': to_luminance,
+}
+
+
+LEGACY_PAYLOAD = "Product ID: 52, Name: Benchmark, Category: Bench, Start Date: 2024-09-01, End Date: 2025-06-30"
+
+
+def frame_bytes_for(size, image_format):
+    frame = synthetic_frame(size, LEGACY_PAYLOAD, code_fraction=0.5)
+    return encode_frame(frame, image_format)
+
+
+def _maxrss_bytes():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _measure(pipeline, frame_bytes, repeat, results):
+    luminance = PIPELINES[pipeline]
+
+    def run(data):
+        image = Image.open(BytesIO(data))
+        return pyzbar.decode(luminance(image))
+
+    # تحميل zbar والمكتبات قبل القياس حتى لا تُحسب في الذروة
+    run(frame_bytes_for((64, 64), 'PNG'))
+
+    baseline = _maxrss_bytes()
+    tracemalloc.start()
+    decoded = run(frame_bytes)
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_peak = _maxrss_bytes() - baseline
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(frame_bytes)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    results.put({
+        'decoded': bool(decoded),
+        'rss_peak_bytes': rss_peak,
+        'traced_peak_bytes': traced_peak,
+        'median_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+    })
+
+
+class Command(BaseCommand):
+    help = ("Compare peak memory and decode latency of the old float64 grayscale path "
+            "against to_luminance() at 720p and 1080p. Each measurement runs in a fresh "
+            "process so the peak RSS is not polluted by earlier runs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--format', choices=['PNG', 'JPEG'], default='PNG',
+                            help="Frame encoding; PNG is what scan_qr receives from old clients.")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable JSON.")
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('spawn')
+        rows = []
+        for resolution, size in RESOLUTIONS.items():
+            frame_bytes = frame_bytes_for(size, options['format'])
+            for pipeline in PIPELINES:
+                results = context.Queue()
+                process = context.Process(
+                    target=_measure, args=(pipeline, frame_bytes, options['repeat'], results),
+                )
+                process.start()
+                row = results.get()
+                process.join()
+                row.update(resolution=resolution, pipeline=pipeline, format=options['format'])
+                rows.append(row)
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{'res':<7}{'pipeline':<9}{'median ms':>11}{'p95 ms':>9}{'peak RSS MB':>13}{'traced MB':>11}  decoded")
+        for row in rows:
+            self.stdout.write(
+                f"{row['resolution']:<7}{row['pipeline']:<9}{row['median_ms']:>11.1f}{row['p95_ms']:>9.1f}"
+                f"{row['rss_peak_bytes'] / 2**20:>13.1f}{row['traced_peak_bytes'] / 2**20:>11.1f}  {row['decoded']}"
+            )
@@ -0,0 +1,190 @@
+import base64
+import datetime
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+from io import BytesIO
+
+import numpy as np
+import PIL
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from orders.bench import data_url, encode_frame, synthetic_frame
+from orders.models import Item_List
+from orders.qr import encode_payload, parse_payload
+from orders.scanning import DecodeStrategy, to_luminance
+
+# القيمة الأساسية لكل محور، والقيم التي يتم تجربتها حولها
+AXES = {
+    'resolution': ('1280x720', ['640x480', '1280x720', '1920x1080']),
+    'rotation': (0, [0, 10, 30, 45]),
+    'blur': (0, [0, 1.0, 2.5]),
+    'noise': (0, [0, 10, 25]),
+    'code_size': (0.3, [0.1, 0.2, 0.3, 0.5]),
+}
+
+STAGES = ('b64decode', 'image_open', 'grayscale', 'decode', 'payload', 'db_lookup')
+
+
+def _cases(grid):
+    """One axis at a time around the base values, or the full cartesian grid."""
+    names = list(AXES)
+    if grid:
+        for values in itertools.product(*(AXES[name][1] for name in names)):
+            yield dict(zip(names, values))
+        return
+    base = {name: AXES[name][0] for name in names}
+    yield dict(base)
+    for name in names:
+        for value in AXES[name][1]:
+            if value != base[name]:
+                yield {**base, name: value}
+
+
+def _case_key(case):
+    return ' '.join(f"{name}={case[name]}" for name in AXES)
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        'median': round(statistics.median(samples), 3),
+        'p95': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min': round(samples[0], 3),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Time every stage of the scan_qr pipeline (base64 decode, Image.open, grayscale, "
+            "zbar, payload check, DB lookup) on synthetic QR frames and print JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--grid', action='store_true',
+                            help="Run the full cartesian grid instead of one axis at a time.")
+        parser.add_argument('--item-id', type=int,
+                            help="Item encoded in the frames and looked up (default: first item, or 1).")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--compare', help="Earlier JSON report; print stages whose median got slower.")
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help="Slowdown ratio reported by --compare (default 1.2).")
+
+    def handle(self, *args, **options):
+        item_id = options['item_id'] or Item_List.objects.values_list('id', flat=True).order_by('id').first() or 1
+        payload = encode_payload(item_id, datetime.date.today() + datetime.timedelta(days=365))
+        strategy = DecodeStrategy()
+
+        cases = []
+        for case in _cases(options['grid']):
+            size = tuple(int(v) for v in case['resolution'].split('x'))
+            frame = synthetic_frame(
+                size, payload, code_fraction=case['code_size'],
+                rotation=case['rotation'], blur=case['blur'], noise=case['noise'],
+            )
+            posted = data_url(encode_frame(frame, 'PNG'))
+            cases.append({**case, **self._run_case(posted, strategy, options['repeat'])})
+            self.stderr.write(f"{_case_key(case)}: decoded={cases[-1]['decoded']}")
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pillow': PIL.__version__,
+                'numpy': np.__version__,
+                'repeat': options['repeat'],
+                'attempts': list(strategy.attempts),
+                'item_id': item_id,
+            },
+            'cases': cases,
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text)
+        else:
+            self.stdout.write(text)
+
+        if options['compare']:
+            self._compare(options['compare'], report, options['threshold'])
+
+    def _run_case(self, posted, strategy, repeat):
+        stages = {stage: [] for stage in STAGES}
+        attempts = {}
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frame_bytes = base64.b64decode(posted.split(',')[1])
+            stages['b64decode'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            image = Image.open(BytesIO(frame_bytes))
+            image.load()
+            stages['image_open'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            gray = to_luminance(image)
+            stages['grayscale'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            result = strategy.decode(gray)
+            stages['decode'].append(time.perf_counter() - start)
+            for name, ms in result.timings:
+                attempts.setdefault(name, []).append(ms)
+
+            if result.data is None:
+                continue
+            start = time.perf_counter()
+            item_id = parse_payload(result.data).item_id
+            stages['payload'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            Item_List.objects.select_related('category').filter(id=item_id).first()
+            stages['db_lookup'].append(time.perf_counter() - start)
+
+        return {
+            'decoded': result.data is not None,
+            'attempt': result.attempt,
+            'stages_ms': {
+                stage: _summary([s * 1000 for s in samples]) if samples else None
+                for stage, samples in stages.items()
+            },
+            'attempts_ms': {name: _summary(samples) for name, samples in attempts.items()},
+        }
+
+    def _compare(self, path, report, threshold):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        previous = {_case_key(case): case for case in baseline['cases']}
+        for case in report['cases']:
+            old = previous.get(_case_key(case))
+            if old is None:
+                continue
+            if old['decoded'] and not case['decoded']:
+                self.stderr.write(f"REGRESSION {_case_key(case)}: no longer decodes")
+            for stage, now in case['stages_ms'].items():
+                before = old['stages_ms'].get(stage)
+                if now and before and before['median'] > 0 and now['median'] / before['median'] > threshold:
+                    self.stderr.write(
+                        f"REGRESSION {_case_key(case)} {stage}: "
+                        f"{before['median']:.2f} ms -> {now['median']:.2f} ms"
+                    )
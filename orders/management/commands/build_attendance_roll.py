@@ -0,0 +1,21 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from orders.models import Attendance
+
+
+class Command(BaseCommand):
+    help = "Create today's absent attendance rows. Safe to run from cron as often as you like."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Day to build (YYYY-MM-DD), default today.")
+
+    def handle(self, *args, **options):
+        day = options['date'] or timezone.now().date()
+        if Attendance.is_sparse():
+            self.stdout.write("ATTENDANCE_SPARSE is on: absences are derived, nothing to build.")
+            return
+        Attendance.build_roll(day)
+        self.stdout.write(f"{day}: {Attendance.objects.filter(attendance_date=day).count()} attendance rows")
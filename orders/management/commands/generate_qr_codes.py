@@ -0,0 +1,62 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from orders.models import Item_List
+from orders.qr import render_png
+
+
+class Command(BaseCommand):
+    help = ("Render QR codes for many items at once in a process pool. Items whose stored "
+            "payload hash already matches are skipped, so an interrupted run can be resumed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help="Item IDs to render.")
+        parser.add_argument('--all', action='store_true', help="Render every item.")
+        parser.add_argument('--category', type=int, help="Only items of this category ID.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Items written per transaction (default 200).")
+        parser.add_argument('--force', action='store_true', help="Re-render even if the QR is up to date.")
+
+    def handle(self, *args, **options):
+        if not (options['ids'] or options['all'] or options['category']):
+            raise CommandError("Give item IDs, --category or --all.")
+
+        queryset = Item_List.objects.only('id', 'subscription_end_date', 'qr_code', 'qr_payload_hash').order_by('id')
+        if options['ids']:
+            queryset = queryset.filter(id__in=options['ids'])
+        if options['category']:
+            queryset = queryset.filter(category_id=options['category'])
+
+        self.workers = options['workers']
+        total = queryset.count()
+        done = skipped = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for item in queryset.iterator(chunk_size=options['batch_size']):
+                if not options['force'] and item.qr_is_current(check_file=False):
+                    skipped += 1
+                    continue
+                batch.append(item)
+                if len(batch) >= options['batch_size']:
+                    done += self._write_batch(pool, batch)
+                    batch = []
+                    self.stdout.write(f"{done + skipped}/{total} ({done} rendered, {skipped} up to date)")
+            if batch:
+                done += self._write_batch(pool, batch)
+        self.stdout.write(self.style.SUCCESS(f"{done + skipped}/{total} ({done} rendered, {skipped} up to date)"))
+
+    def _write_batch(self, pool, batch):
+        payloads = [item.qr_payload() for item in batch]
+        # render_png في orders.qr لا يستورد النماذج، فيعمل في العامل مع fork أو spawn أو forkserver
+        pngs = list(pool.map(render_png, payloads, chunksize=max(1, len(batch) // (self.workers * 4))))
+        # الملفات تُكتب قبل الـ commit؛ لو توقف الأمر هنا يُعاد رسمها في التشغيل التالي
+        with transaction.atomic():
+            for item, payload, png in zip(batch, payloads, pngs):
+                item.store_qr(png, hashlib.sha256(payload.encode()).hexdigest())
+            Item_List.objects.bulk_update(batch, ['qr_code', 'qr_payload_hash'])
+        return len(batch)
@@ -0,0 +1,68 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+from orders.models import Attendance, AttendanceArchive, AttendanceMonthly, CategoryDaily
+
+BATCH_SIZE = 1000
+
+
+def _counts():
+    return {
+        'arrivals': Count('id', filter=Q(attendance_status=Attendance.PRESENT)),
+        'departures': Count('id', filter=Q(departure_status=Attendance.DEPARTED)),
+    }
+
+
+def _merged(queries, *keys):
+    """Add up the per-table counts of ``queries`` by ``keys``; a month can be partly archived."""
+    totals = {}
+    for query in queries:
+        for row in query.iterator():
+            counts = totals.setdefault(tuple(row[key] for key in keys), [0, 0])
+            counts[0] += row['arrivals']
+            counts[1] += row['departures']
+    return ((*key, arrivals, departures) for key, (arrivals, departures) in totals.items() if arrivals or departures)
+
+
+def _bulk_create(model, rows):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+class Command(BaseCommand):
+    help = "Recompute AttendanceMonthly and CategoryDaily from Attendance and AttendanceArchive."
+
+    def handle(self, *args, **options):
+        tables = (Attendance, AttendanceArchive)
+        monthly = [
+            model.objects.annotate(month=TruncMonth('attendance_date'))
+            .values('item_id', 'month').annotate(**_counts()).order_by()
+            for model in tables
+        ]
+        daily = [
+            model.objects.values('item__category_id', 'attendance_date')
+            .annotate(**_counts()).order_by()
+            for model in tables
+        ]
+        with transaction.atomic():
+            AttendanceMonthly.objects.all().delete()
+            CategoryDaily.objects.all().delete()
+            _bulk_create(AttendanceMonthly, (
+                AttendanceMonthly(item_id=item_id, month=month, arrivals=arrivals, departures=departures)
+                for item_id, month, arrivals, departures in _merged(monthly, 'item_id', 'month')
+            ))
+            _bulk_create(CategoryDaily, (
+                CategoryDaily(category_id=category_id, day=day, arrivals=arrivals, departures=departures)
+                for category_id, day, arrivals, departures in _merged(daily, 'item__category_id', 'attendance_date')
+            ))
+        self.stdout.write(
+            f"{AttendanceMonthly.objects.count()} student-month rows, {CategoryDaily.objects.count()} category-day rows"
+        )
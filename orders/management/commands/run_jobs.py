@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.jobs import claim_next, requeue_stale, run_job
+from orders.models import Job
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (QR rendering, ...). Keep this running next to the web server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        requeue_stale()
+        while True:
+            job = claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            job = run_job(job)
+            if job.status == Job.DONE:
+                self.stdout.write(f"{job.kind} {job.key}: done")
+            else:
+                self.stderr.write(f"{job.kind} {job.key}: {job.status} after {job.attempts} attempt(s)\n{job.last_error}")
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0085_alter_attendance_attendance_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='departure_status',
+            field=models.CharField(choices=[('حضور', 'حضور'), ('انصراف', 'انصراف'), ('غياب', 'غياب')], default='غياب', max_length=10, verbose_name='حالة الانصراف'),
+        ),
+        migrations.AddField(
+            model_name='item_list',
+            name='qr_payload_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='attendance_status',
+            field=models.CharField(choices=[('حضور', 'حضور'), ('انصراف', 'انصراف'), ('غياب', 'غياب')], default='غياب', max_length=10, verbose_name='حالة الحضور'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:23
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_days(apps, schema_editor):
+    # صف واحد لكل طالب في اليوم: نجمع الحضور/الانصراف في أقدم صف ونحذف الباقي
+    Attendance = apps.get_model('orders', 'Attendance')
+    duplicates = (
+        Attendance.objects.values('user_id', 'attendance_date')
+        .annotate(rows=Count('id')).filter(rows__gt=1)
+    )
+    for group in duplicates.iterator():
+        records = list(Attendance.objects.filter(
+            user_id=group['user_id'], attendance_date=group['attendance_date'],
+        ).order_by('id'))
+        keep = records[0]
+        if any(r.attendance_status == 'حضور' for r in records):
+            keep.attendance_status = 'حضور'
+        if any(r.departure_status == 'انصراف' for r in records):
+            keep.departure_status = 'انصراف'
+        keep.save(update_fields=['attendance_status', 'departure_status'])
+        Attendance.objects.filter(id__in=[r.id for r in records[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0087_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_days, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('user_id', 'attendance_date'), name='unique_attendance_per_day'),
+        ),
+    ]
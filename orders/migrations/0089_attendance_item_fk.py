@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0088_attendance_unique_per_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='orders.item_list'),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='attendance_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='departure_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OrphanAttendance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=255)),
+                ('category', models.CharField(max_length=255)),
+                ('subscription_start_date', models.DateField(blank=True, null=True)),
+                ('subscription_end_date', models.DateField(blank=True, null=True)),
+                ('attendance_date', models.DateField()),
+                ('attendance_status', models.CharField(max_length=10, verbose_name='حالة الحضور')),
+                ('departure_status', models.CharField(max_length=10, verbose_name='حالة الانصراف')),
+            ],
+        ),
+    ]
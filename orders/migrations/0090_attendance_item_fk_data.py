@@ -0,0 +1,61 @@
+from django.db import migrations
+
+CHUNK = 2000
+CODES = {'غياب': 0, 'حضور': 1, 'انصراف': 2}
+COPIED_FIELDS = [
+    'user_id', 'name', 'category', 'subscription_start_date', 'subscription_end_date',
+    'attendance_date', 'attendance_status', 'departure_status',
+]
+
+
+def copy_to_item_fk(apps, schema_editor):
+    Attendance = apps.get_model('orders', 'Attendance')
+    Item_List = apps.get_model('orders', 'Item_List')
+    OrphanAttendance = apps.get_model('orders', 'OrphanAttendance')
+    last_id = 0
+    while True:
+        rows = list(Attendance.objects.filter(id__gt=last_id).order_by('id')[:CHUNK])
+        if not rows:
+            break
+        last_id = rows[-1].id
+        item_ids = {int(r.user_id) for r in rows if r.user_id.strip().isdigit()}
+        existing = set(Item_List.objects.filter(id__in=item_ids).values_list('id', flat=True))
+        keep, orphans = [], []
+        for record in rows:
+            user_id = record.user_id.strip()
+            if not user_id.isdigit() or int(user_id) not in existing:
+                # سجل لطالب محذوف: لا يمكن ربطه بمفتاح أجنبي، فيُنقل إلى OrphanAttendance كما هو
+                orphans.append(record)
+                continue
+            record.item_id = int(user_id)
+            record.attendance_code = CODES.get(record.attendance_status, 0)
+            record.departure_code = CODES.get(record.departure_status, 0)
+            keep.append(record)
+        Attendance.objects.bulk_update(keep, ['item', 'attendance_code', 'departure_code'])
+        OrphanAttendance.objects.bulk_create([
+            OrphanAttendance(**{field: getattr(record, field) for field in COPIED_FIELDS}) for record in orphans
+        ])
+        Attendance.objects.filter(id__in=[record.id for record in orphans]).delete()
+
+
+def restore_orphans(apps, schema_editor):
+    # الصفوف المربوطة تحتفظ بأعمدتها المنسوخة، فلا يعود إلا ما نُقل إلى OrphanAttendance
+    Attendance = apps.get_model('orders', 'Attendance')
+    OrphanAttendance = apps.get_model('orders', 'OrphanAttendance')
+    orphans = OrphanAttendance.objects.order_by('id')
+    Attendance.objects.bulk_create(
+        (Attendance(**{field: getattr(record, field) for field in COPIED_FIELDS}) for record in orphans.iterator(chunk_size=CHUNK)),
+        batch_size=CHUNK,
+    )
+    orphans.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0089_attendance_item_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_to_item_fk, restore_orphans),
+    ]
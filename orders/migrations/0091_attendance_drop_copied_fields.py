@@ -0,0 +1,99 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK = 2000
+LABELS = {0: 'غياب', 1: 'حضور', 2: 'انصراف'}
+
+
+def refill_copied_fields(apps, schema_editor):
+    # عكس هذا الملف يعيد الأعمدة المنسوخة فارغة: نملؤها من الطالب قبل رجوع القيد الفريد (user_id, attendance_date)
+    Attendance = apps.get_model('orders', 'Attendance')
+    last_id = 0
+    while True:
+        rows = list(Attendance.objects.filter(id__gt=last_id).select_related('item__category').order_by('id')[:CHUNK])
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for record in rows:
+            item = record.item
+            record.user_id = str(item.id)
+            record.name = item.name
+            record.category = item.category.name
+            # الأعمدة القديمة إلزامية: الطالب بدون تواريخ اشتراك يأخذ يوم الصف نفسه
+            record.subscription_start_date = item.subscription_start_date or record.attendance_date
+            record.subscription_end_date = item.subscription_end_date or record.attendance_date
+            record.attendance_status = LABELS.get(record.attendance_code, 'غياب')
+            record.departure_status = LABELS.get(record.departure_code, 'غياب')
+        Attendance.objects.bulk_update(rows, [
+            'user_id', 'name', 'category', 'subscription_start_date', 'subscription_end_date',
+            'attendance_status', 'departure_status',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0090_attendance_item_fk_data'),
+    ]
+
+    operations = [
+        # الأعمدة المنسوخة تصبح اختيارية قبل حذفها حتى يستطيع العكس إعادتها ثم ملأها
+        migrations.AlterField(
+            model_name='attendance',
+            name='user_id',
+            field=models.CharField(max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='name',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='category',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='subscription_start_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='subscription_end_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RemoveConstraint(
+            model_name='attendance',
+            name='unique_attendance_per_day',
+        ),
+        migrations.RunPython(migrations.RunPython.noop, refill_copied_fields),
+        migrations.RemoveField(model_name='attendance', name='user_id'),
+        migrations.RemoveField(model_name='attendance', name='name'),
+        migrations.RemoveField(model_name='attendance', name='category'),
+        migrations.RemoveField(model_name='attendance', name='subscription_start_date'),
+        migrations.RemoveField(model_name='attendance', name='subscription_end_date'),
+        migrations.RemoveField(model_name='attendance', name='attendance_status'),
+        migrations.RemoveField(model_name='attendance', name='departure_status'),
+        migrations.RenameField(model_name='attendance', old_name='attendance_code', new_name='attendance_status'),
+        migrations.RenameField(model_name='attendance', old_name='departure_code', new_name='departure_status'),
+        migrations.AlterField(
+            model_name='attendance',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='orders.item_list', verbose_name='الطالب'),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='attendance_status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'غياب'), (1, 'حضور'), (2, 'انصراف')], default=0, verbose_name='حالة الحضور'),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='departure_status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'غياب'), (1, 'حضور'), (2, 'انصراف')], default=0, verbose_name='حالة الانصراف'),
+        ),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('item', 'attendance_date'), name='unique_attendance_per_day'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:31
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0091_attendance_drop_copied_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRoll',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Daily roll',
+                'verbose_name_plural': 'Daily roll',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('orders.item_list',),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0092_dailyroll'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceMonthly',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('arrivals', models.PositiveIntegerField(default=0)),
+                ('departures', models.PositiveIntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_months', to='orders.item_list')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('arrivals', models.PositiveIntegerField(default=0)),
+                ('departures', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_days', to='orders.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='attendancemonthly',
+            constraint=models.UniqueConstraint(fields=('month', 'item'), name='unique_attendance_monthly'),
+        ),
+        migrations.AddConstraint(
+            model_name='categorydaily',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='unique_category_daily'),
+        ),
+    ]
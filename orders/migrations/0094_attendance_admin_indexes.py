@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0093_attendance_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='orders.item_list', verbose_name='الطالب'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['attendance_date', 'attendance_status', 'departure_status'], name='attendance_day_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['attendance_date', 'departure_status'], name='attendance_day_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0094_attendance_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s', to='orders.item_list', verbose_name='الطالب'),
+        ),
+        migrations.CreateModel(
+            name='AttendanceArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attendance_date', models.DateField(default=django.utils.timezone.now)),
+                ('attendance_status', models.PositiveSmallIntegerField(choices=[(0, 'غياب'), (1, 'حضور'), (2, 'انصراف')], default=0, verbose_name='حالة الحضور')),
+                ('departure_status', models.PositiveSmallIntegerField(choices=[(0, 'غياب'), (1, 'حضور'), (2, 'انصراف')], default=0, verbose_name='حالة الانصراف')),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s', to='orders.item_list', verbose_name='الطالب')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['attendance_date', 'attendance_status', 'departure_status'], name='archive_day_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='attendancearchive',
+            constraint=models.UniqueConstraint(fields=('item', 'attendance_date'), name='unique_attendance_archive_per_day'),
+        ),
+    ]
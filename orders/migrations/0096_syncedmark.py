@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0095_attendance_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncedMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.UUIDField(unique=True)),
+                ('direction', models.CharField(max_length=10)),
+                ('marked_at', models.DateTimeField()),
+                ('result', models.CharField(choices=[('marked', 'Marked'), ('already_marked', 'Already marked')], max_length=16)),
+                ('received', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='synced_marks', to='orders.item_list')),
+            ],
+        ),
+    ]
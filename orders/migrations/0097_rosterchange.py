@@ -0,0 +1,20 @@
+# Generated by Django 5.0.7 on 2026-10-18 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0096_syncedmark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.PositiveIntegerField(db_index=True)),
+            ],
+        ),
+    ]
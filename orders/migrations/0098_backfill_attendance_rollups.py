@@ -0,0 +1,59 @@
+from django.db import migrations
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+BATCH_SIZE = 1000
+PRESENT, DEPARTED = 1, 2
+
+
+def _totals(querysets, *keys):
+    totals = {}
+    for queryset in querysets:
+        rows = queryset.annotate(
+            arrivals=Count('id', filter=Q(attendance_status=PRESENT)),
+            departures=Count('id', filter=Q(departure_status=DEPARTED)),
+        ).order_by()
+        for row in rows.iterator():
+            counts = totals.setdefault(tuple(row[key] for key in keys), [0, 0])
+            counts[0] += row['arrivals']
+            counts[1] += row['departures']
+    return {key: counts for key, counts in totals.items() if any(counts)}
+
+
+def backfill_rollups(apps, schema_editor):
+    # 0093 أنشأ الجداول فارغة: نحسبها مرة واحدة من Attendance و AttendanceArchive
+    # (مثل rebuild_attendance_rollups) حتى لا تبدأ التقارير من الصفر
+    AttendanceMonthly = apps.get_model('orders', 'AttendanceMonthly')
+    CategoryDaily = apps.get_model('orders', 'CategoryDaily')
+    tables = [apps.get_model('orders', name) for name in ('Attendance', 'AttendanceArchive')]
+    monthly = _totals(
+        [model.objects.annotate(month=TruncMonth('attendance_date')).values('item_id', 'month') for model in tables],
+        'item_id', 'month',
+    )
+    daily = _totals(
+        [model.objects.values('item__category_id', 'attendance_date') for model in tables],
+        'item__category_id', 'attendance_date',
+    )
+    AttendanceMonthly.objects.all().delete()
+    CategoryDaily.objects.all().delete()
+    AttendanceMonthly.objects.bulk_create(
+        [AttendanceMonthly(item_id=item_id, month=month, arrivals=arrivals, departures=departures)
+         for (item_id, month), (arrivals, departures) in monthly.items()],
+        batch_size=BATCH_SIZE,
+    )
+    CategoryDaily.objects.bulk_create(
+        [CategoryDaily(category_id=category_id, day=day, arrivals=arrivals, departures=departures)
+         for (category_id, day), (arrivals, departures) in daily.items()],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0097_rosterchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
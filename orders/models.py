@@ -1,8 +1,18 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, FilteredRelation, Max, Q, Value
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.contrib.auth.models import User
-import qrcode
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.files import File
+from collections import namedtuple
 from io import BytesIO
+from itertools import islice
+import hashlib
+import uuid
+from .qr import encode_payload, parse_payload, render_png
 
 
 class Category(models.Model):
@@ -51,32 +61,126 @@ class Item_List(models.Model):
     subscription_start_date = models.DateField(verbose_name="Subscription Start Date", null=True, blank=True)
     subscription_end_date = models.DateField(verbose_name="Subscription End Date", null=True, blank=True)
     qr_code = models.ImageField(upload_to='qr_codes/', null=True, blank=True)
+    # sha256 لمحتوى الـ QR الحالي، لتجنب إعادة رسم الصورة إذا لم يتغير
+    qr_payload_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     def __str__(self):
-        return f"{str(self.id).zfill(4)} - {self.name}"
-
-    def save(self, *args, **kwargs):
-        if not self.id:
-            super().save(*args, **kwargs)
-
-        qr_data = f"Product ID: {self.id}, Name: {self.name}, Category: {self.category.name}, Start Date: {self.subscription_start_date}, End Date: {self.subscription_end_date}"
-
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
+        return f"{self.formatted_id} - {self.name}"
+
+    @property
+    def formatted_id(self):
+        return str(self.id).zfill(4)
+
+    @staticmethod
+    def subscribed_on(day):
+        """Q for students whose subscription covers ``day``; a missing start or end date is open-ended."""
+        return Item_List.subscribed_between(day, day)
+
+    @staticmethod
+    def subscribed_between(start, end):
+        """Q for students subscribed on any day from ``start`` to ``end``."""
+        return (
+            (Q(subscription_start_date__isnull=True) | Q(subscription_start_date__lte=end))
+            & (Q(subscription_end_date__isnull=True) | Q(subscription_end_date__gte=start))
         )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
 
-        img = qr.make_image(fill='black', back_color='white')
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
+    @classmethod
+    def is_subscribed(cls, item_id, day=None):
+        """
+        Whether the stored subscription covers ``day``. A card only carries
+        the end date it was printed with, so a renewed student's old card is
+        checked here before it is rejected as expired.
+        """
+        day = day or timezone.now().date()
+        return cls.objects.filter(
+            Q(subscription_end_date__isnull=True) | Q(subscription_end_date__gte=day), id=item_id,
+        ).exists()
+
+    def qr_payload(self):
+        return encode_payload(self.id, self.subscription_end_date)
+
+    def qr_payload_digest(self):
+        return hashlib.sha256(self.qr_payload().encode()).hexdigest()
+
+    def qr_is_current(self, check_file=True):
+        if not self.qr_code or self.qr_payload_hash != self.qr_payload_digest():
+            return False
+        return not check_file or self.qr_code.storage.exists(self.qr_code.name)
+
+    def store_qr(self, png, payload_hash):
+        """Write ``png`` as this item's QR file (without saving the row)."""
+        # اسم ثابت لكل طالب: نحذف الملف القديم بدل أن يضيف Django لاحقة عشوائية
         file_name = f"qr_code_{self.id}.png"
-        self.qr_code.save(file_name, File(buffer), save=False)
+        storage = self.qr_code.storage
+        target = self.qr_code.field.generate_filename(self, file_name)
+        for old_name in {self.qr_code.name, target}:
+            if old_name and storage.exists(old_name):
+                storage.delete(old_name)
+        self.qr_code.save(file_name, File(BytesIO(png)), save=False)
+        self.qr_payload_hash = payload_hash
+
+    def render_qr(self):
+        """Render the QR image only if the payload changed; return True if a new file was written."""
+        if self.qr_is_current():
+            return False
+        payload = self.qr_payload()
+        self.store_qr(render_png(payload), self.qr_payload_digest())
+        return True
+
+    def refresh_qr(self):
+        """Render the QR if it is stale and store it without a full save()."""
+        if self.render_qr():
+            Item_List.objects.filter(pk=self.pk).update(qr_code=self.qr_code.name, qr_payload_hash=self.qr_payload_hash)
 
+    def save(self, *args, **kwargs):
+        store_files = getattr(settings, 'QR_STORE_FILES', True)
+        render_inline = not getattr(settings, 'QR_RENDER_ASYNC', False)
+        if store_files and render_inline and self.id:
+            self.render_qr()
         super().save(*args, **kwargs)
+        # بدون ملفات مخزنة، الصورة تُرسم عند الطلب من orders.views.qr_code_image
+        if not store_files or self.qr_is_current():
+            return
+        if render_inline:
+            # صف جديد: الـ payload يحتاج الـ ID، فنحفظ الصورة بدون save() ثانية كاملة
+            self.refresh_qr()
+        else:
+            # الرسم يتم في run_jobs بعيداً عن طلب الأدمن
+            from .jobs import enqueue
+            enqueue('render_qr', key=f"item:{self.pk}", item_id=self.pk)
+
+class Job(models.Model):
+    """A slow side effect queued in the database and run by ``manage.py run_jobs``."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=64)
+    # مهام بنفس kind و key لا تتكرر وهي في الانتظار
+    key = models.CharField(max_length=128, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['kind', 'key', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.key} ({self.status})"
 
 class Cart_List(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -121,57 +225,471 @@ from django.utils import timezone
 
 from datetime import date
 
-class Attendance(models.Model):
-    user_id = models.CharField(max_length=100)
-    name = models.CharField(max_length=255)
-    category = models.CharField(max_length=255) 
-    subscription_start_date = models.DateField()
-    subscription_end_date = models.DateField()
-    attendance_date = models.DateField(default=timezone.now)
+class DailyRoll(Item_List):
+    """Admin view of one day's roster, absences included (see Attendance.roster)."""
+
+    class Meta:
+        proxy = True
+        verbose_name = 'Daily roll'
+        verbose_name_plural = 'Daily roll'
 
+
+class AttendanceRecord(models.Model):
+    """Columns shared by the live Attendance table and AttendanceArchive."""
+    ABSENT = 0
+    PRESENT = 1
+    DEPARTED = 2
     ATTENDANCE_CHOICES = [
-        ('حضور', 'حضور'),
-        ('انصراف', 'انصراف'),
-        ('غياب', 'غياب'),
+        (ABSENT, 'غياب'),
+        (PRESENT, 'حضور'),
+        (DEPARTED, 'انصراف'),
     ]
 
-    # إضافة حقول للحضور والانصراف
-    attendance_status = models.CharField(
-        max_length=10,
+    # الاسم والجامعة وتواريخ الاشتراك تُقرأ من الطالب نفسه (select_related) بدل نسخها في كل صف
+    # بدون فهرس منفصل: القيد الفريد (item, attendance_date) يبدأ بـ item ويكفي للبحث به
+    item = models.ForeignKey(Item_List, on_delete=models.CASCADE, related_name='%(class)s', verbose_name='الطالب', db_index=False)
+    attendance_date = models.DateField(default=timezone.now)
+    attendance_status = models.PositiveSmallIntegerField(
         choices=ATTENDANCE_CHOICES,
-        default='غياب',
+        default=ABSENT,
         verbose_name='حالة الحضور',
     )
-    departure_status = models.CharField(
-        max_length=10,
+    departure_status = models.PositiveSmallIntegerField(
         choices=ATTENDANCE_CHOICES,
-        default='غياب',
+        default=ABSENT,
         verbose_name='حالة الانصراف',
     )
 
+    # اتجاه الرحلة -> (الحقل، القيمة المسجلة)
+    DIRECTIONS = {
+        'arrival': ('attendance_status', PRESENT),
+        'departure': ('departure_status', DEPARTED),
+    }
+
+    class Meta:
+        abstract = True
+
     def __str__(self):
-        return f"{self.name} - {self.attendance_status} / {self.departure_status} - {self.attendance_date}"
+        return f"{self.item.name} - {self.get_attendance_status_display()} / {self.get_departure_status_display()} - {self.attendance_date}"
+
+
+class AttendanceArchive(AttendanceRecord):
+    """Closed months moved out of Attendance by ``manage.py archive_attendance``."""
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'attendance_date'], name='unique_attendance_archive_per_day'),
+        ]
+        indexes = [
+            models.Index(fields=['attendance_date', 'attendance_status', 'departure_status'], name='archive_day_status_idx'),
+        ]
+
+
+
+class OrphanAttendance(models.Model):
+    """
+    Attendance rows whose student was already deleted when Attendance moved
+    to a foreign key (migration 0090), kept with the copied columns they had.
+    """
+    user_id = models.CharField(max_length=100)
+    name = models.CharField(max_length=255)
+    category = models.CharField(max_length=255)
+    subscription_start_date = models.DateField(null=True, blank=True)
+    subscription_end_date = models.DateField(null=True, blank=True)
+    attendance_date = models.DateField()
+    attendance_status = models.CharField(max_length=10, verbose_name='حالة الحضور')
+    departure_status = models.CharField(max_length=10, verbose_name='حالة الانصراف')
+
+    def __str__(self):
+        return f"{self.name} ({self.user_id}) - {self.attendance_date}"
+
+
+class ArchivedDay(ValueError):
+    """A mark for a day that archive_attendance has already moved out of Attendance."""
+
+
+MarkResult = namedtuple('MarkResult', ['already_marked', 'attendance_status', 'departure_status'])
+
+
+class Attendance(AttendanceRecord):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'attendance_date'], name='unique_attendance_per_day'),
+        ]
+        indexes = [
+            # فلاتر الأدمن: يوم (أو مدى أيام) وحده أو مع حالة الحضور/الانصراف، والجامعة عبر item
+            models.Index(fields=['attendance_date', 'attendance_status', 'departure_status'], name='attendance_day_status_idx'),
+            models.Index(fields=['attendance_date', 'departure_status'], name='attendance_day_departure_idx'),
+        ]
+
+    @staticmethod
+    def is_sparse():
+        # ATTENDANCE_SPARSE: لا نكتب صفوف غياب، الغياب = المشتركون بدون صف في ذلك اليوم
+        return getattr(settings, 'ATTENDANCE_SPARSE', False)
+
+    @classmethod
+    def roster(cls, day=None, items=None):
+        """
+        Students expected on ``day`` with that day's ``attendance_status`` and
+        ``departure_status`` annotated; a student without a row counts as absent.
+
+        Works in both storage modes, and reads AttendanceArchive for archived
+        days, so pages and reports should read from here rather than from
+        Attendance rows directly.
+        """
+        day = day or timezone.now().date()
+        items = Item_List.objects.all() if items is None else items
+        archived = cls.archived_through()
+        relation = 'attendancearchive' if archived and day <= archived else 'attendance'
+        return (
+            items.annotate(day_marks=FilteredRelation(relation, condition=Q(**{f"{relation}__attendance_date": day})))
+            .filter(
+                Item_List.subscribed_on(day) | Q(day_marks__isnull=False)
+            )
+            .annotate(
+                attendance_status=Coalesce('day_marks__attendance_status', Value(cls.ABSENT)),
+                departure_status=Coalesce('day_marks__departure_status', Value(cls.ABSENT)),
+            )
+        )
+
+    @classmethod
+    def archived_through(cls):
+        """
+        The last day held in AttendanceArchive (None if nothing is archived).
+
+        Read on every call: MAX over archive_day_status_idx is one index seek,
+        and a per-process cache would not see archive_attendance run from cron.
+        """
+        return AttendanceArchive.objects.aggregate(last=Max('attendance_date'))['last']
 
     @classmethod
-    def mark_attendance(cls, user_id, status, is_departure=False):
+    def archive_before(cls, cutoff, batch_size=5000):
+        """
+        Move rows dated before ``cutoff`` into AttendanceArchive, ``batch_size``
+        at a time (one transaction each); return how many were moved.
+
+        Rollups are left alone: they already count the archived marks.
+        Today is never archived, so scans never look the boundary up.
+        """
+        cutoff = min(cutoff, timezone.now().date())
+        fields = ['item_id', 'attendance_date', 'attendance_status', 'departure_status']
+        moved = 0
+        while True:
+            with transaction.atomic():
+                rows = list(cls.objects.filter(attendance_date__lt=cutoff).order_by('id').values('id', *fields)[:batch_size])
+                if not rows:
+                    break
+                AttendanceArchive.objects.bulk_create(
+                    [AttendanceArchive(**{field: row[field] for field in fields}) for row in rows],
+                    ignore_conflicts=True,
+                )
+                cls.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+        return moved
+
+    @classmethod
+    def build_roll(cls, day=None, batch_size=1000):
+        """
+        Create an absent row for every student subscribed on ``day``.
+
+        Rows that already exist are skipped by the unique constraint, so this
+        is safe to run again or from several processes at once.
+        """
+        day = day or timezone.now().date()
+        items = (
+            Item_List.objects
+            .filter(Item_List.subscribed_on(day))
+            .values_list('id', flat=True)
+            .iterator(chunk_size=batch_size)
+        )
+        rows = (cls(item_id=item_id, attendance_date=day) for item_id in items)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                cls.objects.bulk_create(batch, ignore_conflicts=True)
+
+    @staticmethod
+    def roll_cache_key(day):
+        return f"orders:attendance_roll:{day.isoformat()}"
+
+    @classmethod
+    def ensure_roll(cls, day=None):
+        """
+        Build the roll for ``day`` unless this process already built it at the
+        current roster version.
+
+        The marker is the RosterChange version, which every Item_List save or
+        delete bumps in the database, so a student added or renewed through
+        any process reopens the roll in all of them. Reading it is one MAX on
+        the primary key.
+        """
+        day = day or timezone.now().date()
+        if cls.is_sparse():
+            return False
+        key = cls.roll_cache_key(day)
+        version = RosterChange.current_version()
+        if cache.get(key) == version:
+            return False
+        cls.build_roll(day)
+        cache.set(key, version, 60 * 60 * 48)
+        return True
+
+    @classmethod
+    def mark(cls, item_id, direction, day=None, category_id=None):
+        """Mark ``item_id`` for ``direction`` on ``day``; return True if it was already marked."""
+        return cls.mark_row(item_id, direction, day, category_id, state=False).already_marked
+
+    @classmethod
+    def mark_row(cls, item_id, direction, day=None, category_id=None, state=True):
+        """
+        ``mark``, returning a MarkResult with the row's statuses after the mark.
+
+        ``INSERT … ON CONFLICT DO NOTHING`` creates the day's row already
+        marked. If the row exists, ``UPDATE … WHERE <status> != <target>``
+        marks it. The two row counts decide "already marked", so two scanners
+        can never both report a new mark, and both statements RETURN the new
+        statuses. Only an already-marked row is read back, and only when
+        ``state`` is True. A new mark is added to the rollup tables in the
+        same transaction. Raises ArchivedDay for a day already archived.
+        """
+        field, value = cls.DIRECTIONS[direction]
         today = timezone.now().date()
-        attendance_record, created = cls.objects.get_or_create(
-            user_id=user_id,
-            attendance_date=today,
-            defaults={'attendance_status': 'غياب', 'departure_status': 'غياب'}  # تعيين القيمة الافتراضية إلى غياب
+        day = day or today
+        if day < today:
+            # archive_before لا يأخذ اليوم أبداً، فالتحقق للأيام الماضية فقط ولا يكلف مسح اليوم شيئاً
+            archived = cls.archived_through()
+            if archived and day <= archived:
+                raise ArchivedDay('Day is archived')
+        table = connection.ops.quote_name(cls._meta.db_table)
+        params = {'item_id': item_id, 'day': connection.ops.adapt_datefield_value(day), 'value': value}
+        other = 'departure_status' if field == 'attendance_status' else 'attendance_status'
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (item_id, attendance_date, {field}, {other}) "
+                f"VALUES (%(item_id)s, %(day)s, %(value)s, {cls.ABSENT}) "
+                "ON CONFLICT (item_id, attendance_date) DO NOTHING "
+                "RETURNING attendance_status, departure_status",
+                params,
+            )
+            row = cursor.fetchone()
+            if row is None:
+                # الصف موجود (كشف اليوم أو اتجاه آخر): التحديث المشروط لا ينجح إلا لماسح واحد
+                cursor.execute(
+                    f"UPDATE {table} SET {field} = %(value)s "
+                    f"WHERE item_id = %(item_id)s AND attendance_date = %(day)s AND {field} != %(value)s "
+                    "RETURNING attendance_status, departure_status",
+                    params,
+                )
+                row = cursor.fetchone()
+            if row is None:
+                if not state:
+                    return MarkResult(True, None, None)
+                return MarkResult(True, *cls.objects.values_list('attendance_status', 'departure_status').get(
+                    item_id=item_id, attendance_date=day,
+                ))
+            if category_id is None:
+                category_id = Item_List.objects.values_list('category_id', flat=True).get(id=item_id)
+            cls.count_marks(item_id, category_id, day, **{direction: 1})
+        return MarkResult(False, *row)
+
+    @classmethod
+    def mark_item(cls, item_data, direction, day=None, state=False):
+        """
+        ``mark`` for a scan: ``item_data`` is the dict from orders.item_cache.
+        With ``state=True`` it returns the full MarkResult.
+        """
+        result = cls.mark_row(item_data['id'], direction, day, item_data.get('category_id'), state)
+        return result if state else result.already_marked
+
+    def count_in_rollups(self, sign=1):
+        """Add (sign=1) or remove (sign=-1) this row's marks from the rollups, e.g. around an admin edit."""
+        category_id = Item_List.objects.filter(id=self.item_id).values_list('category_id', flat=True).first()
+        if category_id is None:
+            # الطالب نفسه محذوف، وصفوفه في AttendanceMonthly تُحذف معه
+            return
+        self.count_marks(
+            self.item_id, category_id, self.attendance_date,
+            arrival=sign * (self.attendance_status == self.PRESENT),
+            departure=sign * (self.departure_status == self.DEPARTED),
         )
 
-        # تحديث حالة الحضور أو الانصراف بناءً على المدخلات
-        if not is_departure and status == 'حضور':
-            attendance_record.attendance_status = status
-        elif is_departure and status == 'انصراف':
-            attendance_record.departure_status = status
+    @staticmethod
+    def count_marks(item_id, category_id, day, arrival=0, departure=0):
+        """Add (or with negative numbers, remove) marks in AttendanceMonthly and CategoryDaily."""
+        changes = {'arrivals': arrival, 'departures': departure}
+        _bump(AttendanceMonthly, {'item_id': item_id, 'month': day.replace(day=1)}, changes)
+        _bump(CategoryDaily, {'category_id': category_id, 'day': day}, changes)
+
+
+def _bump(model, lookup, changes):
+    changes = {name: by for name, by in changes.items() if by}
+    if not changes:
+        return
+    rows = model.objects.filter(**lookup)
+    increments = {name: F(name) + by for name, by in changes.items()}
+    if any(by < 0 for by in changes.values()):
+        # لا نقلل عداداً تحت الصفر (مثلاً صفوف أقدم من rebuild_attendance_rollups)
+        rows.filter(**{f"{name}__gte": -by for name, by in changes.items() if by < 0}).update(**increments)
+        return
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **changes)
+    except IntegrityError:
+        rows.update(**increments)
+
+
+class AttendanceMonthly(models.Model):
+    """Marks per student per month, kept current by Attendance.mark."""
+    item = models.ForeignKey(Item_List, on_delete=models.CASCADE, related_name='attendance_months')
+    month = models.DateField(help_text='First day of the month')
+    arrivals = models.PositiveIntegerField(default=0)
+    departures = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'item'], name='unique_attendance_monthly'),
+        ]
+
+
+class CategoryDaily(models.Model):
+    """Marks per category (university) per day, kept current by Attendance.mark."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='attendance_days')
+    day = models.DateField()
+    arrivals = models.PositiveIntegerField(default=0)
+    departures = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_category_daily'),
+        ]
+
+
+class SyncedMark(models.Model):
+    """A mark queued on a scanner while offline, kept by its client key so a re-sent batch is applied once."""
+    MARKED = 'marked'
+    ALREADY_MARKED = 'already_marked'
+    RESULT_CHOICES = [
+        (MARKED, 'Marked'),
+        (ALREADY_MARKED, 'Already marked'),
+    ]
 
-        # التحقق من تحديث الحالة الافتراضية
-        if attendance_record.attendance_status == 'غياب' and not is_departure:
-            attendance_record.attendance_status = status
-        if attendance_record.departure_status == 'غياب' and is_departure:
-            attendance_record.departure_status = status
+    key = models.UUIDField(unique=True)
+    item = models.ForeignKey(Item_List, on_delete=models.CASCADE, related_name='synced_marks')
+    direction = models.CharField(max_length=10)
+    # وقت المسح على الجهاز، وليس وقت وصوله
+    marked_at = models.DateTimeField()
+    result = models.CharField(max_length=16, choices=RESULT_CHOICES)
+    received = models.DateTimeField(auto_now_add=True)
 
-        attendance_record.save()
-        return attendance_record
+    def __str__(self):
+        return f"{self.key} {self.item_id} {self.direction} ({self.result})"
+
+    @staticmethod
+    def parse(mark, now):
+        """(key, item_id, direction, marked_at) from one uploaded mark; ValueError if it is unusable."""
+        if not isinstance(mark, dict):
+            raise ValueError('Invalid mark')
+        try:
+            key = uuid.UUID(str(mark.get('key')))
+        except ValueError:
+            raise ValueError('Invalid key')
+        direction = mark.get('direction')
+        if direction not in Attendance.DIRECTIONS:
+            raise ValueError('Invalid direction')
+        marked_at = parse_datetime(str(mark.get('marked_at') or ''))
+        if marked_at is None:
+            raise ValueError('Invalid marked_at')
+        if timezone.is_naive(marked_at):
+            marked_at = timezone.make_aware(marked_at)
+        # ساعة الجهاز قد تكون متقدمة
+        marked_at = min(marked_at, now)
+        if mark.get('qr'):
+            # مسح بدون اتصال: البطاقة نفسها تُتحقق هنا
+            payload = parse_payload(mark['qr'])
+            day = timezone.localdate(marked_at)
+            if payload.is_expired(day) and not Item_List.is_subscribed(payload.item_id, day):
+                raise ValueError('Subscription expired')
+            item_id = payload.item_id
+        else:
+            try:
+                item_id = int(mark.get('item_id'))
+            except (TypeError, ValueError):
+                raise ValueError('Invalid item ID')
+        return key, item_id, direction, marked_at
+
+    @classmethod
+    def sync(cls, marks):
+        """
+        Apply a batch of queued marks in one transaction and return one result
+        per mark, in order: ``{'key', 'id', 'result'}`` plus ``duplicate`` for a
+        key applied before, or ``error`` for a mark that can never be applied.
+
+        Every mark in the response is settled; the scanner can drop it from its queue.
+        """
+        now = timezone.now()
+        results, pending = [], []
+        for mark in marks:
+            result = {'key': mark.get('key') if isinstance(mark, dict) else None}
+            try:
+                pending.append((result, *cls.parse(mark, now)))
+            except ValueError as e:
+                result.update(result='invalid', error=str(e))
+            results.append(result)
+
+        archived = Attendance.archived_through()
+        with transaction.atomic():
+            seen = cls.objects.in_bulk([key for _, key, *_ in pending], field_name='key')
+            categories = dict(
+                Item_List.objects.filter(id__in=[item_id for _, _, item_id, *_ in pending]).values_list('id', 'category_id')
+            )
+            new = {}
+            for result, key, item_id, direction, marked_at in pending:
+                result['id'] = item_id
+                day = timezone.localdate(marked_at)
+                earlier = seen.get(key) or new.get(key)
+                if earlier is not None:
+                    result.update(result=earlier.result, duplicate=True)
+                elif item_id not in categories:
+                    result.update(result='invalid', error='Item not found')
+                elif archived and day <= archived:
+                    result.update(result='invalid', error='Day is archived')
+                else:
+                    already_marked = Attendance.mark(item_id, direction, day, categories[item_id])
+                    new[key] = cls(
+                        key=key, item_id=item_id, direction=direction, marked_at=marked_at,
+                        result=cls.ALREADY_MARKED if already_marked else cls.MARKED,
+                    )
+                    result['result'] = new[key].result
+            # دفعة مكررة وصلت في نفس اللحظة: Attendance.mark لا يكرر العلامة، والمفتاح يُحفظ مرة واحدة
+            cls.objects.bulk_create(new.values(), ignore_conflicts=True)
+        return results
+
+
+class RosterChange(models.Model):
+    """
+    The roster version log for scanner devices (see orders.roster). Each
+    student keeps only its latest row, whose id is the version it changed at;
+    a row for a deleted student is its tombstone.
+    """
+    # بدون FK: السطر يبقى بعد حذف الطالب ليعرف الجهاز أنه حُذف
+    item_id = models.PositiveIntegerField(db_index=True)
+
+    @classmethod
+    def record(cls, item_ids):
+        """Give ``item_ids`` a new version (e.g. after a save or a delete)."""
+        item_ids = list(item_ids)
+        if not item_ids:
+            return
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(item_id=item_id) for item_id in item_ids])
+            # السطر الأحدث لا يُحذف أبداً، فلا يعيد SQLite استخدام رقم إصدار
+            latest = cls.objects.filter(item_id__in=item_ids).values('item_id').annotate(last=Max('id')).values('last')
+            cls.objects.filter(item_id__in=item_ids).exclude(id__in=latest).delete()
+
+    @classmethod
+    def current_version(cls):
+        return cls.objects.aggregate(version=Max('id'))['version'] or 0
@@ -0,0 +1,148 @@
+"""
+What goes inside a student card QR code, and how it is rendered.
+
+Cards carry a compact signed payload: ``E1`` followed by unpadded base32 of
+the item ID, the subscription end date and a truncated HMAC keyed on
+SECRET_KEY. It is short enough for a version 1 QR code in alphanumeric
+mode, and the server rejects forged cards without touching the database.
+A card past its printed end date is checked against the stored
+subscription (Item_List.is_subscribed) first, so renewing does not need a
+reprint. Cards printed before this format ("Product ID: 12, Name: ...")
+still parse, but carry no trusted end date.
+"""
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+from io import BytesIO
+import base64
+import hmac
+import struct
+
+import qrcode
+from PIL import Image
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+PAYLOAD_PREFIX = 'E1'
+LEGACY_PREFIX = 'Product ID:'
+
+_EPOCH = date(2000, 1, 1)
+# رقم الطالب (4 بايت) + تاريخ نهاية الاشتراك كعدد أيام من _EPOCH (0 = بدون نهاية)
+_BODY = struct.Struct('>IH')
+_MAC_BYTES = 8
+_MAC_SALT = 'orders.qr.payload'
+
+
+class InvalidPayload(ValueError):
+    pass
+
+
+class QRPayload(namedtuple('QRPayload', ['item_id', 'end_date', 'signed'])):
+
+    def is_expired(self, day=None):
+        if self.end_date is None:
+            return False
+        return self.end_date < (day or timezone.now().date())
+
+
+def _mac(body):
+    return salted_hmac(_MAC_SALT, body, algorithm='sha256').digest()[:_MAC_BYTES]
+
+
+def encode_payload(item_id, end_date=None):
+    days = (end_date - _EPOCH).days if end_date else 0
+    body = _BODY.pack(item_id, days)
+    return PAYLOAD_PREFIX + base64.b32encode(body + _mac(body)).decode('ascii').rstrip('=')
+
+
+def parse_payload(data):
+    data = data.strip()
+    if data.startswith(PAYLOAD_PREFIX):
+        encoded = data[len(PAYLOAD_PREFIX):]
+        try:
+            raw = base64.b32decode(encoded + '=' * (-len(encoded) % 8))
+        except ValueError:
+            raise InvalidPayload('Invalid QR code.')
+        if len(raw) != _BODY.size + _MAC_BYTES:
+            raise InvalidPayload('Invalid QR code.')
+        body, mac = raw[:_BODY.size], raw[_BODY.size:]
+        if not hmac.compare_digest(mac, _mac(body)):
+            raise InvalidPayload('Invalid QR signature.')
+        item_id, days = _BODY.unpack(body)
+        return QRPayload(item_id, _EPOCH + timedelta(days=days) if days else None, True)
+
+    if data.startswith(LEGACY_PREFIX):
+        # الصيغة القديمة: "Product ID: 12, Name: ..., End Date: ..."
+        item_id = data.split(',')[0].split(':')[-1].strip()
+        if item_id.isdigit():
+            return QRPayload(int(item_id), None, False)
+    raise InvalidPayload('Invalid QR code.')
+
+
+def make_qr(data):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def render_png(data):
+    img = make_qr(data).make_image(fill='black', back_color='white')
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_sized_png(data, size):
+    """A 1-bit PNG of ``size`` x ``size`` pixels (never smaller than one pixel per module)."""
+    matrix = make_qr(data).get_matrix()
+    modules = len(matrix)
+    image = Image.new('1', (modules, modules), 1)
+    image.putdata([0 if cell else 1 for row in matrix for cell in row])
+    scale = max(1, size // modules)
+    image = image.resize((modules * scale, modules * scale), Image.NEAREST)
+    if image.width < size:
+        # هامش أبيض لتعويض باقي القسمة
+        canvas = Image.new('1', (size, size), 1)
+        offset = (size - image.width) // 2
+        canvas.paste(image, (offset, offset))
+        image = canvas
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def render_svg(data, size):
+    """An SVG with one path of horizontal runs; scales to any size without blur."""
+    matrix = make_qr(data).get_matrix()
+    modules = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < modules and row[x]:
+                x += 1
+            path.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="{modules}" height="{modules}" fill="#fff"/>'
+        f'<path d="{"".join(path)}" fill="#000"/></svg>'
+    ).encode()
+
+
+@lru_cache(maxsize=256)
+def render_cached(data, image_format, size):
+    """Rendered bytes for the on-demand QR view, kept in a small per-process LRU."""
+    if image_format == 'svg':
+        return render_svg(data, size)
+    return render_sized_png(data, size)
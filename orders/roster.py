@@ -0,0 +1,46 @@
+"""
+The roster feed scanner devices keep a local copy of: ``roster/?since=<version>``.
+
+Saving or deleting a student, or renaming their university, gives the
+student a new version in RosterChange. A device keeps the version of its
+last sync and asks only for what changed after it: the current rows of
+those students, plus the IDs of deleted ones in ``deleted``. ``since=0``
+(or a version the server has never issued) is a full download of current
+subscriptions.
+
+Rows are lists in the order of ``fields`` to keep the payload small.
+Writes made with QuerySet.update() skip the signals and must call
+``RosterChange.record``.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Item_List, RosterChange
+
+FIELDS = ['id', 'name', 'category', 'subscription_start_date', 'subscription_end_date', 'image_url']
+
+
+def _rows(queryset):
+    storage = Item_List._meta.get_field('image').storage
+    rows = queryset.order_by('id').values_list(
+        'id', 'name', 'category__name', 'subscription_start_date', 'subscription_end_date', 'image',
+    )
+    for item_id, name, category, start, end, image in rows.iterator(chunk_size=2000):
+        yield [
+            item_id, name, category,
+            start and start.isoformat(), end and end.isoformat(),
+            storage.url(image) if image else None,
+        ]
+
+
+def roster_feed(since, version):
+    """The feed from ``since`` up to ``version`` (see RosterChange.current_version)."""
+    if since <= 0 or since > version:
+        today = timezone.now().date()
+        items = Item_List.objects.filter(Q(subscription_end_date__gte=today) | Q(subscription_end_date__isnull=True))
+        return {'version': version, 'full': True, 'fields': FIELDS, 'items': list(_rows(items)), 'deleted': []}
+
+    changed = set(RosterChange.objects.filter(id__gt=since, id__lte=version).values_list('item_id', flat=True))
+    items = list(_rows(Item_List.objects.filter(id__in=changed)))
+    deleted = sorted(changed - {row[0] for row in items})
+    return {'version': version, 'full': False, 'fields': FIELDS, 'items': items, 'deleted': deleted}
@@ -0,0 +1,190 @@
+from collections import namedtuple
+from io import BytesIO
+import base64
+import logging
+import math
+import time
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+from pyzbar import pyzbar
+from pyzbar.pyzbar import ZBarSymbol
+
+logger = logging.getLogger(__name__)
+
+# أكبر حجم مقبول لإطار الكاميرا المرسل من المتصفح
+MAX_FRAME_BYTES = 8 * 1024 * 1024
+MAX_FRAME_PIXELS = 4096 * 4096
+
+
+class FrameError(ValueError):
+    pass
+
+
+def frame_from_data_url(data_url):
+    """Old clients: a canvas.toDataURL('image/png') string."""
+    header, _, encoded = data_url.partition(',')
+    if not header.startswith('data:') or len(encoded) > MAX_FRAME_BYTES * 4 // 3 + 4:
+        raise FrameError('Invalid image data.')
+    try:
+        image_bytes = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise FrameError('Invalid image data.')
+    return _load(BytesIO(image_bytes))
+
+
+def _load(source):
+    """
+    Open a JPEG/PNG frame and decode it now: Image.open only reads the
+    header, so a truncated file would otherwise fail later, outside any
+    request error handling.
+    """
+    try:
+        image = Image.open(source)
+        if image.format not in ('JPEG', 'PNG'):
+            raise FrameError('Unsupported frame format.')
+        if image.width * image.height > MAX_FRAME_PIXELS:
+            raise FrameError('Frame is too large.')
+        _draft_gray(image)
+        image.load()
+    except UnidentifiedImageError:
+        raise FrameError('Unsupported frame format.')
+    except (OSError, Image.DecompressionBombError):
+        raise FrameError('Invalid image data.')
+    return image
+
+
+def _draft_gray(image):
+    if image.format == 'JPEG' and image.mode in ('RGB', 'YCbCr', 'CMYK'):
+        # libjpeg يفك اللون الرمادي مباشرة بدون قنوات الألوان
+        image.draft('L', image.size)
+
+
+def frame_from_request(request):
+    """
+    Read a frame straight from the upload, without any base64 step.
+
+    The frame is either a multipart file field called ``frame`` or the raw
+    request body (``application/octet-stream``). It is a JPEG/PNG image, or
+    8-bit grayscale pixels when ``width`` and ``height`` are given.
+    """
+    upload = request.FILES.get('frame')
+    if upload is not None:
+        if upload.size > MAX_FRAME_BYTES:
+            raise FrameError('Frame is too large.')
+        source, params = upload, request.POST
+    else:
+        source, params = request, request.GET
+
+    width, height = params.get('width'), params.get('height')
+    if width and height:
+        try:
+            size = (int(width), int(height))
+        except ValueError:
+            raise FrameError('Invalid frame size.')
+        if size[0] <= 0 or size[1] <= 0 or size[0] * size[1] > MAX_FRAME_PIXELS:
+            raise FrameError('Invalid frame size.')
+        data = source.read(size[0] * size[1])
+        if len(data) != size[0] * size[1]:
+            raise FrameError('Frame is shorter than width x height.')
+        return Image.frombuffer('L', size, data, 'raw', 'L', 0, 1)
+
+    if upload is None:
+        data = source.read(MAX_FRAME_BYTES + 1)
+        if len(data) > MAX_FRAME_BYTES:
+            raise FrameError('Frame is too large.')
+        source = BytesIO(data)
+    return _load(source)
+
+
+def to_luminance(image):
+    """
+    Return an 8-bit single-channel ('L') copy of any Pillow frame.
+
+    Works on uint8 the whole way: Pillow's convert('L') uses integer
+    ITU-R 601-2 weights, so no float64 array is ever built.
+    """
+    if image.mode == 'L':
+        return image
+    _draft_gray(image)
+    if image.mode == 'L':
+        return image
+    if image.mode.startswith('I;16') or image.mode == 'I':
+        return image.convert('I').point(lambda v: v * (1 / 256)).convert('L')
+    if image.mode in ('LA', 'PA', 'RGBA') or 'transparency' in image.info:
+        # المناطق الشفافة تصبح بيضاء مثل الورق
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    try:
+        return image.convert('L')
+    except ValueError:
+        return image.convert('RGB').convert('L')
+
+
+DecodeResult = namedtuple('DecodeResult', ['data', 'attempt', 'timings'])
+
+
+class DecodeStrategy:
+    """
+    Run zbar on cheap views of the frame first and stop at the first hit.
+
+    The attempts are named methods tried in ``attempts`` order: ``downscaled``
+    (a box-reduced copy), ``center`` (the middle of the frame at full
+    resolution, for codes that are small in the frame) and ``full``. Every
+    attempt is timed so the order can be tuned from the logged numbers via
+    ``settings.QR_DECODE_ATTEMPTS``.
+    """
+    default_attempts = ('downscaled', 'center', 'full')
+
+    def __init__(self, attempts=None, downscale_width=640, center_fraction=0.5):
+        if attempts is None:
+            attempts = getattr(settings, 'QR_DECODE_ATTEMPTS', self.default_attempts)
+        for name in attempts:
+            if name not in self.default_attempts:
+                raise ValueError(f"Unknown decode attempt: {name}")
+        self.attempts = tuple(attempts)
+        self.downscale_width = downscale_width
+        self.center_fraction = center_fraction
+
+    def downscaled(self, image):
+        factor = math.ceil(image.width / self.downscale_width)
+        if factor <= 1:
+            return None  # الإطار صغير أصلاً، محاولة full تكفي
+        return image.reduce(factor)
+
+    def center(self, image):
+        width = int(image.width * self.center_fraction)
+        height = int(image.height * self.center_fraction)
+        left = (image.width - width) // 2
+        top = (image.height - height) // 2
+        return image.crop((left, top, left + width, top + height))
+
+    def full(self, image):
+        return image
+
+    def decode(self, image, deadline=None):
+        """``deadline`` is a time.time() value; attempts not started by then are skipped."""
+        gray = to_luminance(image)
+        timings = []
+        for name in self.attempts:
+            if deadline is not None and time.time() >= deadline:
+                break
+            start = time.perf_counter()
+            frame = getattr(self, name)(gray)
+            if frame is None:
+                continue
+            symbols = pyzbar.decode(frame, symbols=[ZBarSymbol.QRCODE])
+            timings.append((name, (time.perf_counter() - start) * 1000))
+            if symbols:
+                result = DecodeResult(symbols[0].data.decode('utf-8'), name, timings)
+                break
+        else:
+            result = DecodeResult(None, None, timings)
+        logger.debug(
+            "qr decode %s %s (%dx%d)",
+            result.attempt or 'miss',
+            ' '.join(f"{name}={ms:.1f}ms" for name, ms in timings),
+            gray.width, gray.height,
+        )
+        return result
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import item_cache
+from .models import Category, Item_List, RosterChange
+
+
+@receiver(post_save, sender=Item_List)
+@receiver(post_delete, sender=Item_List)
+def invalidate_item(sender, instance, **kwargs):
+    item_cache.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Item_List)
+@receiver(post_delete, sender=Item_List)
+def bump_roster(sender, instance, **kwargs):
+    # الإصدار الجديد يعيد فتح كشف اليوم أيضاً في كل العمليات (Attendance.ensure_roll)
+    RosterChange.record([instance.id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_items(sender, instance, **kwargs):
+    # اسم الجامعة جزء من بيانات كل طالب فيها
+    item_cache.invalidate(*Item_List.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def bump_category_roster(sender, instance, created, **kwargs):
+    # حذف الجامعة يحذف طلابها، وكل حذف يسجل نفسه في bump_roster
+    if not created:
+        RosterChange.record(Item_List.objects.filter(category=instance).values_list('id', flat=True))
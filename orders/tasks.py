@@ -0,0 +1,9 @@
+from .jobs import job
+from .models import Item_List
+
+
+@job('render_qr')
+def render_qr(item_id):
+    item = Item_List.objects.select_related('category').filter(id=item_id).first()
+    if item is not None:
+        item.refresh_qr()
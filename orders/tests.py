@@ -1,3 +1,920 @@
-from django.test import TestCase
+from datetime import date, datetime
+from io import BytesIO, StringIO
+from unittest import mock
+import base64
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import Http404
+from django.shortcuts import resolve_url
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from .models import ArchivedDay, Attendance, AttendanceArchive, AttendanceMonthly, Category, CategoryDaily, DailyRoll, Item_List, Job, RosterChange, SyncedMark
+from . import item_cache
+from .admin import CategoryFilter
+from .cards import CARD_SIZE, DEFAULT_FONT, MIN_NAME_SIZE, NAME_MARGIN, check_card_font, fit_name, render_card, shape, stream_card_zip
+from .decode_pool import DecodePool, DecodeTimeout
+from .exports import roster_rows
+from .jobs import enqueue
+from .qr import InvalidPayload, encode_payload, parse_payload
+from .scanning import DecodeStrategy
+from .views import _check_payload
+
+
+# صور QR المرسومة عند الحفظ تُكتب في مجلد مؤقت وليس في media/ الخاص بالمشروع
+_test_media = override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+
+
+def setUpModule():
+    _test_media.enable()
+
+
+def tearDownModule():
+    _test_media.disable()
+    shutil.rmtree(_test_media.options['MEDIA_ROOT'])
+
+
+class AttendanceMarkConcurrencyTests(TransactionTestCase):
+    day = date(2026, 10, 18)
+    threads = 8
+
+    def setUp(self):
+        category = Category.objects.create(name='Cairo University')
+        item = Item_List.objects.create(
+            category=category, name='Ahmed',
+            subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2027, 6, 30),
+        )
+        self.item_data = {
+            'id': item.id,
+            'name': item.name,
+            'category': category.name,
+            'subscription_start_date': item.subscription_start_date,
+            'subscription_end_date': item.subscription_end_date,
+        }
+
+    def hammer(self, directions):
+        barrier = threading.Barrier(len(directions))
+        results, errors = [], []
+
+        def scan(direction):
+            try:
+                barrier.wait()
+                results.append((direction, Attendance.mark_item(self.item_data, direction, self.day)))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=scan, args=(direction,)) for direction in directions]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_one_new_mark_when_row_is_missing(self):
+        results = self.hammer(['arrival'] * self.threads)
+        self.assertEqual([already for _, already in results].count(False), 1)
+        self.assertEqual(AttendanceMonthly.objects.get(item_id=self.item_data['id']).arrivals, 1)
+        self.assertEqual(CategoryDaily.objects.get(day=self.day).arrivals, 1)
+        record = Attendance.objects.get(item_id=self.item_data['id'], attendance_date=self.day)
+        self.assertEqual(record.attendance_status, Attendance.PRESENT)
+        self.assertEqual(record.departure_status, Attendance.ABSENT)
+
+    def test_one_new_mark_on_existing_roll_row(self):
+        Attendance.build_roll(self.day)
+        results = self.hammer(['arrival'] * self.threads)
+        self.assertEqual([already for _, already in results].count(False), 1)
+        self.assertEqual(Attendance.objects.filter(attendance_date=self.day).count(), 1)
+
+    def test_arrival_and_departure_together_keep_both(self):
+        results = self.hammer(['arrival', 'departure'] * (self.threads // 2))
+        for direction in Attendance.DIRECTIONS:
+            self.assertEqual([already for d, already in results if d == direction].count(False), 1)
+        record = Attendance.objects.get(item_id=self.item_data['id'], attendance_date=self.day)
+        self.assertEqual((record.attendance_status, record.departure_status), (Attendance.PRESENT, Attendance.DEPARTED))
+
+    def test_second_mark_reports_already_marked(self):
+        self.assertFalse(Attendance.mark_item(self.item_data, 'arrival', self.day))
+        self.assertTrue(Attendance.mark_item(self.item_data, 'arrival', self.day))
+        self.assertFalse(Attendance.mark_item(self.item_data, 'departure', self.day))
+
+    def test_already_marked_comes_from_row_counts(self):
+        Attendance.mark_item(self.item_data, 'arrival', self.day)
+        # INSERT … ON CONFLICT DO NOTHING ثم UPDATE مشروط، بدون SELECT
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(Attendance.mark_item(self.item_data, 'arrival', self.day))
+        self.assertFalse([query for query in queries if query['sql'].lstrip().upper().startswith('SELECT')])
+
+    def test_mark_returns_new_state(self):
+        result = Attendance.mark_item(self.item_data, 'departure', self.day, state=True)
+        self.assertEqual(result, (False, Attendance.ABSENT, Attendance.DEPARTED))
+        result = Attendance.mark_item(self.item_data, 'arrival', self.day, state=True)
+        self.assertEqual(result, (False, Attendance.PRESENT, Attendance.DEPARTED))
+        result = Attendance.mark_item(self.item_data, 'arrival', self.day, state=True)
+        self.assertEqual(result, (True, Attendance.PRESENT, Attendance.DEPARTED))
+
+
+class AttendanceRollupTests(TestCase):
+
+    def setUp(self):
+        self.enterContext(mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2026, 10, 18, 9))))
+        self.category = Category.objects.create(name='Cairo University')
+        self.items = [
+            Item_List.objects.create(
+                category=self.category, name=name,
+                subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2027, 6, 30),
+            )
+            for name in ('Ahmed', 'Mona')
+        ]
+
+    def rollups(self):
+        return (
+            sorted(AttendanceMonthly.objects.values_list('item_id', 'month', 'arrivals', 'departures')),
+            sorted(CategoryDaily.objects.values_list('category_id', 'day', 'arrivals', 'departures')),
+        )
+
+    def test_marks_match_rebuild(self):
+        first, second = self.items
+        for day in (date(2026, 10, 1), date(2026, 10, 2), date(2026, 11, 1)):
+            Attendance.mark(first.id, 'arrival', day)
+            Attendance.mark(first.id, 'arrival', day)
+            Attendance.mark(first.id, 'departure', day)
+        Attendance.mark(second.id, 'arrival', date(2026, 10, 2))
+        Attendance.build_roll(date(2026, 10, 3))
+
+        self.assertEqual(AttendanceMonthly.objects.get(item=first, month=date(2026, 10, 1)).arrivals, 2)
+        self.assertEqual(CategoryDaily.objects.get(day=date(2026, 10, 2)).arrivals, 2)
+        incremental = self.rollups()
+        call_command('rebuild_attendance_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_roll_includes_open_ended_subscriptions(self):
+        open_ended = Item_List.objects.create(category=self.category, name='Omar')
+        expired = Item_List.objects.create(category=self.category, name='Sara', subscription_end_date=date(2026, 9, 30))
+        Attendance.build_roll(date(2026, 10, 1))
+        rolled = set(Attendance.objects.values_list('item_id', flat=True))
+        self.assertEqual(rolled, {item.id for item in self.items} | {open_ended.id})
+        self.assertNotIn(expired.id, rolled)
+
+    def test_roll_reopens_after_a_change_in_another_process(self):
+        day = date(2026, 10, 18)
+        # الكاش المحلي يبقى بين الاختبارات، وأرقام الإصدار تتكرر بعد rollback
+        cache.delete(Attendance.roll_cache_key(day))
+        self.assertTrue(Attendance.ensure_roll(day))
+        self.assertFalse(Attendance.ensure_roll(day))
+        # عملية أخرى تضيف طالباً: لا تصل إلى كاش هذه العملية، فقط إلى RosterChange في قاعدة البيانات
+        with mock.patch('orders.signals.RosterChange.record'):
+            late = Item_List.objects.create(category=self.category, name='Omar')
+        self.assertFalse(Attendance.ensure_roll(day))
+        RosterChange.record([late.id])
+        self.assertTrue(Attendance.ensure_roll(day))
+        self.assertTrue(Attendance.objects.filter(item=late, attendance_date=day).exists())
+        self.assertFalse(Attendance.ensure_roll(day))
+
+    def test_delete_removes_marks(self):
+        Attendance.mark(self.items[0].id, 'arrival', date(2026, 10, 1))
+        request = RequestFactory().post('/')
+        admin.site._registry[Attendance].delete_queryset(request, Attendance.objects.all())
+        self.assertEqual(CategoryDaily.objects.get().arrivals, 0)
+        self.assertEqual(AttendanceMonthly.objects.get().arrivals, 0)
+
+    def test_archive_keeps_history(self):
+        first, second = self.items
+        old_day, new_day = date(2026, 9, 15), date(2026, 10, 1)
+        Attendance.mark(first.id, 'arrival', old_day)
+        Attendance.mark(first.id, 'departure', old_day)
+        Attendance.build_roll(old_day)
+        Attendance.mark(second.id, 'arrival', new_day)
+        rollups = self.rollups()
+
+        self.assertEqual(Attendance.archive_before(date(2026, 10, 1)), 2)
+        self.assertEqual(Attendance.archive_before(date(2026, 10, 1)), 0)
+        self.assertEqual(AttendanceArchive.objects.count(), 2)
+        self.assertFalse(Attendance.objects.filter(attendance_date=old_day).exists())
+        self.assertEqual(Attendance.archived_through(), old_day)
+        self.assertEqual(self.rollups(), rollups)
+        call_command('rebuild_attendance_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), rollups)
+
+        roster = {row['id']: row for row in Attendance.roster(old_day).values('id', 'attendance_status', 'departure_status')}
+        self.assertEqual(roster[first.id]['attendance_status'], Attendance.PRESENT)
+        self.assertEqual(roster[first.id]['departure_status'], Attendance.DEPARTED)
+        self.assertEqual(roster[second.id]['attendance_status'], Attendance.ABSENT)
+
+    def test_marks_for_archived_days_are_rejected(self):
+        first, _ = self.items
+        old_day = date(2026, 9, 15)
+        Attendance.mark(first.id, 'arrival', old_day)
+        Attendance.archive_before(date(2026, 10, 1))
+        rollups = self.rollups()
+
+        with self.assertRaises(ArchivedDay):
+            Attendance.mark(first.id, 'departure', old_day)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.post('/admin/orders/attendance/add/', {
+            'item': first.id, 'attendance_date': old_day.isoformat(), 'attendance_status': Attendance.PRESENT, 'departure_status': Attendance.ABSENT,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attendance_date', response.context['adminform'].form.errors)
+        self.assertFalse(Attendance.objects.exists())
+        self.assertEqual(self.rollups(), rollups)
+        self.assertFalse(Attendance.mark(first.id, 'arrival', date(2026, 10, 1)))
+
+    def test_archive_never_takes_today(self):
+        Attendance.mark(self.items[0].id, 'arrival')
+        self.assertEqual(Attendance.archive_before(date(2026, 12, 1)), 0)
+        self.assertFalse(Attendance.mark(self.items[0].id, 'departure'))
+
+    def test_archived_through_sees_other_processes(self):
+        self.assertIsNone(Attendance.archived_through())
+        # archive_attendance من cron يكتب الأرشيف في عملية أخرى، بدون أي مسح لكاش هذه العملية
+        AttendanceArchive.objects.create(item=self.items[0], attendance_date=date(2026, 9, 15))
+        self.assertEqual(Attendance.archived_through(), date(2026, 9, 15))
+        AttendanceArchive.objects.create(item=self.items[0], attendance_date=date(2026, 9, 30))
+        self.assertEqual(Attendance.archived_through(), date(2026, 9, 30))
+
+
+@override_settings(ATTENDANCE_SPARSE=True)
+class AttendanceSparseTests(TestCase):
+    day = date(2026, 10, 18)
+
+    def setUp(self):
+        category = Category.objects.create(name='Cairo University')
+        self.present = Item_List.objects.create(
+            category=category, name='Ahmed',
+            subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2027, 6, 30),
+        )
+        self.absent = Item_List.objects.create(category=category, name='Omar')
+        self.expired = Item_List.objects.create(category=category, name='Sara', subscription_end_date=date(2026, 9, 30))
+        # طالب انتهى اشتراكه لكن سُجل حضوره في ذلك اليوم يبقى في الكشف
+        self.late = Item_List.objects.create(category=category, name='Mona', subscription_end_date=date(2026, 10, 1))
+
+    def test_roll_writes_nothing(self):
+        self.assertFalse(Attendance.ensure_roll(self.day))
+        call_command('build_attendance_roll', date=self.day, stdout=StringIO())
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_roster_derives_absences(self):
+        Attendance.mark(self.present.id, 'arrival', self.day)
+        Attendance.mark(self.late.id, 'arrival', self.day)
+        roster = {item.id: (item.attendance_status, item.departure_status) for item in Attendance.roster(self.day)}
+        self.assertEqual(roster, {
+            self.present.id: (Attendance.PRESENT, Attendance.ABSENT),
+            self.late.id: (Attendance.PRESENT, Attendance.ABSENT),
+            self.absent.id: (Attendance.ABSENT, Attendance.ABSENT),
+        })
+        self.assertEqual(Attendance.objects.count(), 2)
+
+    def test_pages_list_absent_students(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        Attendance.mark(self.present.id, 'arrival', self.day)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2026, 10, 18, 9))):
+            page = self.client.get('/attendance/today/')
+            changelist = self.client.get('/admin/orders/dailyroll/', {'day': self.day.isoformat()})
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(changelist.status_code, 200)
+        self.assertEqual(
+            {item.id for item in page.context['attendance_list']},
+            {self.present.id, self.absent.id},
+        )
+        self.assertContains(changelist, 'Omar')
+        self.assertNotContains(changelist, 'Sara')
+        self.assertFalse(Attendance.objects.exclude(item=self.present).exists())
+
+
+
+class CategoryFilterTests(TestCase):
+    day = date(2026, 10, 18)
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Cairo University')
+        self.items = [
+            Item_List.objects.create(
+                category=self.category, name=name,
+                subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2027, 6, 30),
+            )
+            for name in ('Ahmed', 'Mona', 'Omar')
+        ]
+        Attendance.mark(self.items[0].id, 'arrival', self.day)
+        Attendance.mark(self.items[1].id, 'arrival', self.day)
+        Attendance.mark(self.items[1].id, 'arrival', date(2026, 10, 17))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def labels(self, response):
+        spec = next(spec for spec in response.context['cl'].filter_specs if isinstance(spec, CategoryFilter))
+        return dict(spec.lookup_choices)
+
+    def test_labels_count_arrivals_for_the_selected_days(self):
+        category_id = str(self.category.id)
+        one_day = self.client.get('/admin/orders/attendance/', {'attendance_date': self.day.isoformat()})
+        self.assertEqual(self.labels(one_day)[category_id], 'Cairo University (2 حضور)')
+        week = self.client.get('/admin/orders/attendance/', {
+            'attendance_date__gte': '2026-10-12', 'attendance_date__lt': '2026-10-19',
+        })
+        self.assertEqual(self.labels(week)[category_id], 'Cairo University (3 حضور)')
+        roll = self.client.get('/admin/orders/dailyroll/', {'day': self.day.isoformat()})
+        self.assertEqual(self.labels(roll)[category_id], 'Cairo University (2 حضور)')
+        # الكشف يعرض كل الطلاب (الغائب أيضاً) والعدد يبقى عدد الحضور فقط
+        self.assertEqual(roll.context['cl'].result_count, 3)
+
+    def test_base_filter_defaults_to_today(self):
+        request = RequestFactory().get('/')
+        with mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2026, 10, 18, 9))):
+            self.assertEqual(CategoryFilter.days(None, request), (self.day, date(2026, 10, 19)))
+
+
+class AttendanceExportTests(TestCase):
+    days = [date(2026, 10, 1), date(2026, 10, 2), date(2026, 10, 3)]
+
+    def setUp(self):
+        self.enterContext(mock.patch('django.utils.timezone.now', return_value=timezone.make_aware(datetime(2026, 10, 18, 9))))
+        self.cairo = Category.objects.create(name='Cairo University')
+        self.ain_shams = Category.objects.create(name='Ain Shams University')
+        subscribed = {'subscription_start_date': date(2026, 9, 1), 'subscription_end_date': date(2027, 6, 30)}
+        self.ahmed = Item_List.objects.create(category=self.cairo, name='Ahmed', **subscribed)
+        self.mona = Item_List.objects.create(category=self.cairo, name='Mona')
+        self.omar = Item_List.objects.create(category=self.ain_shams, name='Omar', **subscribed)
+        self.sara = Item_List.objects.create(category=self.cairo, name='Sara', subscription_end_date=date(2026, 10, 1))
+        Attendance.mark(self.ahmed.id, 'arrival', self.days[0])
+        Attendance.mark(self.ahmed.id, 'departure', self.days[0])
+        Attendance.mark(self.omar.id, 'arrival', self.days[1])
+        # اشتراك سارة انتهى لكنها سُجلت في اليوم التالي
+        Attendance.mark(self.sara.id, 'arrival', self.days[1])
+        Attendance.mark(self.mona.id, 'arrival', self.days[2])
+        Attendance.archive_before(self.days[1])
+
+    def roster_reference(self, category_id=None, arrival=None, departure=None):
+        rows = []
+        for day in self.days:
+            roster = Attendance.roster(day)
+            if category_id:
+                roster = roster.filter(category_id=category_id)
+            for direction, wanted in (('arrival', arrival), ('departure', departure)):
+                field, value = Attendance.DIRECTIONS[direction]
+                if wanted is True:
+                    roster = roster.filter(**{field: value})
+                elif wanted is False:
+                    roster = roster.exclude(**{field: value})
+            rows += [
+                (item_id, name, category, day, arrived, departed)
+                for item_id, name, category, arrived, departed in roster.order_by('category__name', 'id')
+                .values_list('id', 'name', 'category__name', 'attendance_status', 'departure_status')
+            ]
+        return rows
+
+    def test_rows_match_the_daily_roster(self):
+        filters = [
+            {}, {'category_id': self.cairo.id}, {'arrival': True}, {'arrival': False},
+            {'departure': True}, {'arrival': True, 'departure': False},
+        ]
+        for sparse in (True, False):
+            with self.subTest(sparse=sparse), override_settings(ATTENDANCE_SPARSE=sparse):
+                if not sparse:
+                    Attendance.build_roll(self.days[2])
+                for options in filters:
+                    with self.subTest(**options):
+                        expected = self.roster_reference(**options)
+                        with CaptureQueriesContext(connection) as queries:
+                            rows = list(roster_rows(self.days[0], self.days[-1], **options))
+                        self.assertEqual(rows, expected)
+                        self.assertLessEqual(len(queries), 4)
+        self.assertIn((self.sara.id, 'Sara', 'Cairo University', self.days[1], Attendance.PRESENT, Attendance.ABSENT), rows)
+
+    def test_query_count_does_not_grow_with_the_range(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(roster_rows(date(2026, 9, 1), date(2026, 11, 30)))
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(len([row for row in rows if row[0] == self.omar.id]), 91)
+
+    def test_csv_and_xlsx_views(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        params = {'from': '2026-10-01', 'to': '2026-10-03', 'category': self.cairo.id, 'arrival': '1'}
+        response = self.client.get('/attendance/export/', {**params, 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(lines, [
+            'ID,الاسم,الجامعة,التاريخ,حالة الحضور,حالة الانصراف',
+            f'{self.ahmed.formatted_id},Ahmed,Cairo University,2026-10-01,حضور,انصراف',
+            f'{self.sara.formatted_id},Sara,Cairo University,2026-10-02,حضور,غياب',
+            f'{self.mona.formatted_id},Mona,Cairo University,2026-10-03,حضور,غياب',
+        ])
+
+        response = self.client.get('/attendance/export/', {**params, 'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 4)
+        self.assertIn('<t>Sara</t>', sheet)
+        self.assertNotIn('<t>Omar</t>', sheet)
+
+    def test_bad_parameters(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        for params in (
+            {'format': 'pdf'}, {'from': '2026-13-01'}, {'from': '2026-10-03', 'to': '2026-10-01'},
+            {'category': 'cairo'}, {'arrival': 'yes'},
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.client.get('/attendance/export/', params).status_code, 400)
+
+class AttendanceSyncTests(TestCase):
+    """Marks queued offline on a scanner and uploaded to attendance/sync/."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Cairo University')
+        self.item = Item_List.objects.create(
+            category=self.category, name='Ahmed',
+            subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2027, 6, 30),
+        )
+        self.client.force_login(User.objects.create_user('scanner', password='password'))
+
+    def sync(self, marks):
+        response = self.client.post('/attendance/sync/', {'marks': marks}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def mark(self, **fields):
+        return {'key': str(uuid.uuid4()), 'direction': 'arrival', 'marked_at': '2026-10-01T07:15:00Z', **fields}
+
+    def test_resent_batch_is_applied_once(self):
+        marks = [
+            self.mark(item_id=self.item.id),
+            self.mark(qr=encode_payload(self.item.id, self.item.subscription_end_date), direction='departure'),
+            self.mark(item_id=self.item.id),
+        ]
+        first = self.sync(marks)
+        self.assertEqual([r['result'] for r in first], ['marked', 'marked', 'already_marked'])
+        again = self.sync(marks)
+        self.assertEqual([r['result'] for r in again], ['marked', 'marked', 'already_marked'])
+        self.assertTrue(all(r['duplicate'] for r in again))
+
+        row = Attendance.objects.get(item=self.item, attendance_date=date(2026, 10, 1))
+        self.assertEqual((row.attendance_status, row.departure_status), (Attendance.PRESENT, Attendance.DEPARTED))
+        self.assertEqual(CategoryDaily.objects.values_list('arrivals', 'departures').get(), (1, 1))
+        self.assertEqual(SyncedMark.objects.count(), 3)
+
+    def test_bad_marks_are_settled(self):
+        expired = Item_List.objects.create(
+            category=self.category, name='Mona',
+            subscription_start_date=date(2026, 1, 1), subscription_end_date=date(2026, 9, 30),
+        )
+        results = self.sync([
+            self.mark(item_id=999),
+            self.mark(item_id=self.item.id, direction='sideways'),
+            self.mark(qr=encode_payload(expired.id, expired.subscription_end_date)),
+            {'key': 'not-a-uuid', 'direction': 'arrival', 'item_id': self.item.id},
+        ])
+        self.assertEqual([r['result'] for r in results], ['invalid'] * 4)
+        self.assertEqual([r['error'] for r in results[:3]], ['Item not found', 'Invalid direction', 'Subscription expired'])
+        self.assertFalse(Attendance.objects.exists())
+
+
+class RosterFeedTests(TestCase):
+    """roster/?since=<version> returns only the students changed after that version."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('driver', password='password'))
+        self.category = Category.objects.create(name='Cairo University')
+        self.items = [
+            Item_List.objects.create(
+                category=self.category, name=name,
+                subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2099, 6, 30),
+            )
+            for name in ('Ahmed', 'Mona', 'Omar')
+        ]
+
+    def feed(self, since, **headers):
+        return self.client.get('/roster/', {'since': since}, headers=headers)
+
+    def test_delta_and_tombstones(self):
+        full = self.feed(0).json()
+        self.assertTrue(full['full'])
+        self.assertEqual(sorted(row[0] for row in full['items']), [item.id for item in self.items])
+        version = full['version']
+
+        ahmed, mona, omar = self.items
+        mona.name = 'Mona Ali'
+        mona.save()
+        omar_id = omar.id
+        omar.delete()
+        delta = self.feed(version).json()
+        self.assertFalse(delta['full'])
+        self.assertEqual([row[:2] for row in delta['items']], [[mona.id, 'Mona Ali']])
+        self.assertEqual(delta['deleted'], [omar_id])
+
+        self.category.name = 'Ain Shams'
+        self.category.save()
+        delta = self.feed(delta['version']).json()
+        self.assertEqual(sorted(row[0] for row in delta['items']), [ahmed.id, mona.id])
+        self.assertEqual(RosterChange.objects.count(), 3)
+
+    def test_current_device_gets_304(self):
+        response = self.feed(RosterChange.current_version())
+        self.assertEqual(response.json()['items'], [])
+        again = self.feed(RosterChange.current_version(), If_None_Match=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+
+class AttendanceQueryPlanTests(TestCase):
+    """The admin's filter queries must use an index, not scan orders_attendance."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.category = Category.objects.create(name='Cairo University')
+        for n in range(20):
+            item = Item_List.objects.create(
+                category=self.category, name=f'student {n}',
+                subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2027, 6, 30),
+            )
+            Attendance.mark(item.id, 'arrival', date(2026, 10, 1))
+
+    def changelist_plan(self, model_admin, params):
+        request = RequestFactory().get('/', params)
+        request.user = self.user
+        return model_admin.get_changelist_instance(request).queryset.explain()
+
+    def assertNoScan(self, plan):
+        self.assertNotIn('SCAN orders_attendance', plan)
+        self.assertNotIn('SCAN day_marks', plan)
+
+    def test_attendance_admin_filters(self):
+        model_admin = admin.site._registry[Attendance]
+        for params in (
+            {'attendance_date': '2026-10-01'},
+            {'attendance_date__gte': '2026-10-01', 'attendance_date__lt': '2026-10-08'},
+            {'attendance_date': '2026-10-01', 'attendance_status__exact': '1'},
+            {'attendance_date': '2026-10-01', 'departure_status__exact': '0'},
+            {'attendance_date': '2026-10-01', 'category': str(self.category.id)},
+        ):
+            with self.subTest(params=params):
+                self.assertNoScan(self.changelist_plan(model_admin, params))
+
+    def test_daily_roll(self):
+        model_admin = admin.site._registry[DailyRoll]
+        for params in ({}, {'day': '2026-10-01', 'attendance_status': '0'}):
+            with self.subTest(params=params):
+                self.assertNoScan(self.changelist_plan(model_admin, params))
+
+    def test_mark(self):
+        rows = Attendance.objects.filter(item_id=1, attendance_date=date(2026, 10, 1))
+        self.assertNoScan(rows.exclude(attendance_status=Attendance.PRESENT).explain())
+
+
+class FrameInputTests(TestCase):
+    """Bad frames are a 400 with a message, never a 500."""
+
+    def test_malformed_data_url(self):
+        for image in ('not a data url', 'data:image/png;base64,!!!', 'data:image/png;base64,aGVsbG8='):
+            with self.subTest(image=image):
+                response = self.client.post('/scan_qr/', {'image': image})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def png(self, size=(200, 200)):
+        out = BytesIO()
+        Image.new('L', size, 255).save(out, 'PNG')
+        return out.getvalue()
+
+    def post_frame(self, data):
+        return self.client.post('/scan_qr/frame/', data, content_type='application/octet-stream')
+
+    def test_truncated_png(self):
+        truncated = self.png()[:-40]
+        response = self.post_frame(truncated)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid image data.')
+        data_url = 'data:image/png;base64,' + base64.b64encode(truncated).decode()
+        self.assertEqual(self.client.post('/scan_qr/', {'image': data_url}).status_code, 400)
+
+    def test_oversized_png(self):
+        # PNG صغير الحجم بالبايت لكن أبعاده فوق MAX_FRAME_PIXELS
+        response = self.post_frame(self.png((4097, 4096)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Frame is too large.')
+
+    def test_oversized_upload(self):
+        with mock.patch('orders.scanning.MAX_FRAME_BYTES', 1000):
+            upload = SimpleUploadedFile('frame.png', self.png() + b'\0' * 1000, content_type='image/png')
+            response = self.client.post('/scan_qr/frame/', {'frame': upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Frame is too large.')
+
+
+def _stuck_full(self, image):
+    # إطار بعرض 201 فقط يعلق مثل zbar عالق؛ الإطارات الأخرى (والإحماء) تمر
+    if image.width == 201:
+        time.sleep(60)
+    return image
+
+
+class DecodePoolTimeoutTests(SimpleTestCase):
+    """A decode that never returns must not keep its worker and slot."""
+
+    def pool(self, workers=1):
+        # fork: العمال يبدأون مع الـ pool ويرثون الـ patch
+        pool = DecodePool(workers=workers, queue_size=0, timeout=0.5, attempts=('full',), start_method='fork')
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_stuck_worker_is_replaced(self):
+        with mock.patch.object(DecodeStrategy, 'full', _stuck_full):
+            pool = self.pool()
+            stuck = list(pool._executor._processes.values())
+            with self.assertRaises(DecodeTimeout):
+                pool.decode(Image.new('L', (201, 200), 255))
+
+            deadline = time.time() + 10
+            while (pool.stats()['queue_depth'] or any(p.is_alive() for p in stuck)) and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(pool.stats()['queue_depth'], 0)
+            self.assertFalse(any(p.is_alive() for p in stuck))
+            result, _ = pool.decode(Image.new('L', (200, 200), 255))
+            self.assertIsNone(result.data)
+
+    def test_workers_start_with_the_pool(self):
+        pool = self.pool(workers=2)
+        self.assertEqual(len(pool._executor._processes), 2)
+        replacement = pool._replace(pool._executor)
+        self.assertEqual(len(replacement._processes), 2)
+
+
+class QRPayloadTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Cairo University')
+        self.item = Item_List.objects.create(
+            category=category, name='Ahmed',
+            subscription_start_date=date(2025, 9, 1), subscription_end_date=date(2026, 6, 30),
+        )
+        self.old_card = encode_payload(self.item.id, date(2026, 6, 30))
+
+    def test_round_trip(self):
+        payload = parse_payload(encode_payload(1234, date(2027, 6, 30)))
+        self.assertEqual(payload, (1234, date(2027, 6, 30), True))
+        self.assertEqual(parse_payload(encode_payload(5)).end_date, None)
+
+    def test_tampered(self):
+        data = self.old_card
+        for tampered in (data[:5] + ('A' if data[5] != 'A' else 'B') + data[6:], data[:-2], 'E1' + '!' * 10):
+            with self.subTest(tampered=tampered), self.assertRaises(InvalidPayload):
+                parse_payload(tampered)
+
+    def test_legacy(self):
+        payload = parse_payload('Product ID: 12, Name: Ahmed, End Date: 2020-01-01')
+        self.assertEqual(payload, (12, None, False))
+        with self.assertRaises(InvalidPayload):
+            parse_payload('Product ID: abc, Name: Ahmed')
+
+    def test_expired(self):
+        self.assertTrue(parse_payload(self.old_card).is_expired(date(2026, 7, 1)))
+        item_id, error = _check_payload(self.old_card, {})
+        self.assertIsNone(item_id)
+        self.assertEqual(error.status_code, 403)
+
+    def test_renewed_student_keeps_old_card(self):
+        self.item.subscription_end_date = date(2099, 6, 30)
+        self.item.save()
+        self.assertEqual(_check_payload(self.old_card, {}), (self.item.id, None))
+        results = SyncedMark.sync([{
+            'key': str(uuid.uuid4()), 'direction': 'arrival', 'marked_at': '2026-10-01T07:15:00Z', 'qr': self.old_card,
+        }])
+        self.assertEqual(results[0]['result'], 'marked')
+
+
+class ScanAndMarkTests(TestCase):
+    """scan_and_mark/ marks and answers in one round trip."""
+
+    def setUp(self):
+        # IDs تتكرر بين الاختبارات، فلا نقرأ بيانات اختبار سابق من الكاش
+        item_cache.get_backend().clear()
+        category = Category.objects.create(name='Cairo University')
+        self.item = Item_List.objects.create(
+            category=category, name='Ahmed',
+            subscription_start_date=date(2026, 9, 1), subscription_end_date=date(2099, 6, 30),
+        )
+        self.client.force_login(User.objects.create_user('scanner', password='password'))
+
+    def scan(self, **data):
+        return self.client.post('/scan_and_mark/', {'item_id': self.item.id, 'direction': 'arrival', **data})
+
+    def test_anonymous_writes_are_rejected(self):
+        self.client.logout()
+        mark = {'key': str(uuid.uuid4()), 'direction': 'arrival', 'marked_at': '2026-10-01T07:15:00Z', 'item_id': self.item.id}
+        for response in (
+            self.scan(),
+            self.client.post('/attendance/sync/', {'marks': [mark]}, content_type='application/json'),
+        ):
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith(resolve_url(settings.LOGIN_URL) + '?next='))
+        self.assertFalse(Attendance.objects.exists())
+        self.assertFalse(SyncedMark.objects.exists())
+
+    def test_response(self):
+        data = self.scan().json()
+        self.assertEqual((data['id'], data['name'], data['category']), (self.item.id, 'Ahmed', 'Cairo University'))
+        self.assertEqual((data['direction'], data['already_marked']), ('arrival', False))
+        self.assertEqual((data['attendance_status'], data['departure_status']), ('حضور', 'غياب'))
+
+        data = self.scan(direction='departure').json()
+        self.assertEqual((data['attendance_status'], data['departure_status']), ('حضور', 'انصراف'))
+        data = self.scan().json()
+        self.assertTrue(data['already_marked'])
+        self.assertEqual((data['attendance_status'], data['departure_status']), ('حضور', 'انصراف'))
+
+    def test_errors(self):
+        self.assertEqual(self.scan(direction='sideways').status_code, 400)
+        self.assertEqual(self.scan(item_id='abc').status_code, 400)
+        self.assertEqual(self.scan(item_id=999).status_code, 404)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class ItemCacheTests(TestCase):
+
+    def setUp(self):
+        item_cache.get_backend().clear()
+        self.category = Category.objects.create(name='Cairo University')
+        self.item = Item_List.objects.create(category=self.category, name='Ahmed')
+
+    def test_invalidated_on_save_and_delete(self):
+        self.assertEqual(item_cache.get_item_data(self.item.id)['name'], 'Ahmed')
+        with self.assertNumQueries(0):
+            item_cache.get_item_data(self.item.id)
+
+        self.item.name = 'Ahmed Ali'
+        self.item.save()
+        self.assertEqual(item_cache.get_item_data(self.item.id)['name'], 'Ahmed Ali')
+
+        self.category.name = 'Ain Shams'
+        self.category.save()
+        self.assertEqual(item_cache.get_item_data(self.item.id)['category'], 'Ain Shams')
+
+        item_id = self.item.id
+        self.item.delete()
+        with self.assertRaises(Http404):
+            item_cache.get_item_data(item_id)
+
+
+class GenerateQRCodesTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        # الحفظ لا يرسم الملفات، فالأمر هو من يرسمها
+        self.enterContext(override_settings(MEDIA_ROOT=media, QR_RENDER_ASYNC=True))
+        category = Category.objects.create(name='Cairo University')
+        self.items = [
+            Item_List.objects.create(category=category, name=name, subscription_end_date=date(2027, 6, 30))
+            for name in ('Ahmed', 'Mona')
+        ]
+        self.media = media
+
+    def generate(self):
+        out = StringIO()
+        call_command('generate_qr_codes', '--all', '--workers', '1', stdout=out)
+        return out.getvalue().strip().splitlines()[-1]
+
+    def test_up_to_date_items_are_skipped(self):
+        self.assertIn('(2 rendered, 0 up to date)', self.generate())
+        self.assertIn('(0 rendered, 2 up to date)', self.generate())
+
+        # تحديث بدون save(): الـ hash القديم لا يطابق، فيُعاد رسم نفس الملف بدون لاحقة
+        Item_List.objects.filter(id=self.items[0].id).update(subscription_end_date=date(2028, 6, 30))
+        self.assertIn('(1 rendered, 1 up to date)', self.generate())
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.media, 'qr_codes'))),
+            sorted(f"qr_code_{item.id}.png" for item in self.items),
+        )
+
+
+class RunJobsTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media, QR_RENDER_ASYNC=True))
+        self.category = Category.objects.create(name='Cairo University')
+
+    def test_render_job(self):
+        item = Item_List.objects.create(category=self.category, name='Ahmed', subscription_end_date=date(2027, 6, 30))
+        job = Job.objects.get(kind='render_qr')
+        self.assertFalse(Item_List.objects.get(id=item.id).qr_code)
+
+        call_command('run_jobs', '--once', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        item.refresh_from_db()
+        self.assertTrue(item.qr_is_current())
+
+    def test_admin_shows_pending_until_rendered(self):
+        item_admin = admin.site._registry[Item_List]
+        item = Item_List.objects.create(category=self.category, name='Ahmed', subscription_end_date=date(2027, 6, 30))
+        self.assertEqual(item_admin.qr_code_tag(item), 'pending')
+        call_command('run_jobs', '--once', stdout=StringIO())
+        item.refresh_from_db()
+        self.assertIn('<img', item_admin.qr_code_tag(item))
+
+        # تجديد الاشتراك: الملف القديم لا يطابق الـ payload الجديد حتى يرسمه run_jobs
+        item.subscription_end_date = date(2028, 6, 30)
+        item.save()
+        self.assertEqual(item_admin.qr_code_tag(item), 'pending')
+        call_command('run_jobs', '--once', stdout=StringIO())
+        item.refresh_from_db()
+        self.assertIn('<img', item_admin.qr_code_tag(item))
+
+    def test_failed_job_is_retried_later(self):
+        job = enqueue('no_such_kind', key='x')
+        self.assertIsNone(enqueue('no_such_kind', key='x'))
+        call_command('run_jobs', '--once', stdout=StringIO(), stderr=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertIn('No handler registered', job.last_error)
+        self.assertGreater(job.run_after, job.updated)
+
+
+class QRImageTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        category = Category.objects.create(name='Cairo University')
+        self.item = Item_List.objects.create(category=category, name='Ahmed', subscription_end_date=date(2027, 6, 30))
+        self.url = f'/qr/{self.item.id}/'
+
+    def test_etag_and_304(self):
+        response = self.client.get(self.url, {'size': 150})
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/png'))
+        self.assertEqual(Image.open(BytesIO(response.content)).size, (150, 150))
+        etag = response['ETag']
+
+        again = self.client.get(self.url, {'size': 150}, headers={'If-None-Match': etag})
+        self.assertEqual((again.status_code, again.content), (304, b''))
+        self.assertNotEqual(self.client.get(self.url, {'size': 150, 'format': 'svg'})['ETag'], etag)
+
+        # تجديد الاشتراك يغير الـ payload، فالـ ETag القديم لا يطابق
+        self.item.subscription_end_date = date(2028, 6, 30)
+        self.item.save()
+        self.assertEqual(self.client.get(self.url, {'size': 150}, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_versioned_link_is_immutable(self):
+        response = self.client.get(self.url, {'v': self.item.qr_payload_digest()[:12]})
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.client.get(self.url, {'v': 'stale'})
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(self.url, {'format': 'gif'}).status_code, 400)
+
+
+class CardFontTests(TestCase):
+
+    def test_default_font_passes_startup_check(self):
+        self.assertEqual(check_card_font(None), [])
+        with override_settings(QR_CARD_FONT='/no/such/font.ttf'):
+            self.assertEqual([error.id for error in check_card_font(None)], ['orders.E001'])
+
+    def test_arabic_name_is_drawn(self):
+        category = Category.objects.create(name='Cairo University')
+        item = Item_List.objects.create(category=category, name='أحمد', subscription_end_date=date(2027, 6, 30))
+        # حروف عربية موصولة (presentation forms)، وتُرسم بدل مربعات notdef
+        self.assertTrue(all('\ufb50' <= letter <= '\ufeff' for letter in shape('أحمد')))
+        # DejaVu ليس فيه الرمز ﷲ، فتُكتب الحروف منفصلة بدل مربع
+        self.assertNotIn('\ufdf2', shape('عبد الله'))
+        drawn = render_card(item)
+        item.name = '\ue000' * 4
+        self.assertNotEqual(drawn.tobytes(), render_card(item).tobytes())
+
+        names = zipfile.ZipFile(BytesIO(b''.join(stream_card_zip([item])))).namelist()
+        self.assertEqual(names, [f'{item.formatted_id}.png'])
+
+    def test_long_names_fit_the_card(self):
+        category = Category.objects.create(name='Cairo University')
+        item = Item_List.objects.create(category=category, name='Ahmed', subscription_end_date=date(2027, 6, 30))
+        draw = ImageDraw.Draw(Image.new('L', CARD_SIZE, 255))
+        text, font = fit_name(draw, item.name, ImageFont.truetype(DEFAULT_FONT, 28))
+        self.assertEqual((text, font.size), ('Ahmed', 28))
+
+        for name in ['Mohamed Abdelrahman Mahmoud Ibrahim', 'محمد عبد الرحمن محمود إبراهيم السيد', 'M' * 200]:
+            item.name = name
+            card = render_card(item)
+            # لا حبر في الهامشين على جانبي الاسم
+            ink = ImageOps.invert(card).getbbox()
+            self.assertGreaterEqual(ink[0], NAME_MARGIN - 1)
+            self.assertLessEqual(ink[2], CARD_SIZE[0] - NAME_MARGIN + 1)
+
+        text, font = fit_name(draw, 'M' * 200, ImageFont.truetype(DEFAULT_FONT, 28))
+        self.assertEqual(font.size, MIN_NAME_SIZE)
+        self.assertTrue(text.endswith('\u2026'))
@@ -10,5 +10,14 @@ urlpatterns = [
     path("signup", views.signup_view, name="signup"),
     path('scan_qr_by_id/', views.scan_qr_by_id, name='scan_qr_by_id'),  # مسار لإدخال ID يدوي
     path('scan_qr/', views.scan_qr, name='scan_qr'),
+    path('scan_qr/frame/', views.scan_qr_frame, name='scan_qr_frame'),  # إطار خام أو JPEG بدون base64
+    path('scan_qr/status/', views.scan_qr_status, name='scan_qr_status'),  # حالة طابور فك QR
+    path('scan_and_mark/', views.scan_and_mark, name='scan_and_mark'),  # فك + تسجيل في طلب واحد
     path('attendance/', views.attendance_view, name='attendance'),
+    path('roster/', views.roster, name='roster'),  # ?since=<version> للنسخة المحلية على الماسح
+    path('attendance/sync/', views.attendance_sync, name='attendance_sync'),  # علامات الماسح بدون اتصال
+    path('attendance/export/', views.attendance_export, name='attendance_export'),  # ?from&to&category&arrival&departure&format=csv|xlsx
+    path('attendance/today/', views.attendance_reset_view, name='attendance_today'),  # كشف اليوم بالغياب
+    path('qr/<int:item_id>/', views.qr_code_image, name='qr_code_image'),  # ?format=png|svg&size=150
+    path('qr/cards/', views.qr_cards, name='qr_cards'),  # ?category=<id>&format=zip|png|pdf
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,20 +1,28 @@
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import UserCreationForm
-from django.http import HttpResponseRedirect, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
-from PIL import Image
-import base64
-import numpy as np
-from pyzbar import pyzbar
+from django.conf import settings
+import hashlib
 import json
-from io import BytesIO  # تم إضافة الاستيراد الصحيح هنا
+import math
 from datetime import date
-from .models import Size, Category, Topping, Price_List, Item_List, Cart_List, Extra, Order, ImageSlider, Attendance
+from .models import Size, Category, Topping, Price_List, Item_List, Cart_List, Extra, Order, ImageSlider, Attendance, SyncedMark, RosterChange
+from .cards import CARD_OUTPUTS, cards_response
+from .exports import EXPORT_FORMATS, export_response, roster_rows
+from .item_cache import get_item_data
+from .decode_pool import DecodeTimeout, PoolBusy, get_pool
+from .roster import roster_feed
+from .qr import InvalidPayload, encode_payload, parse_payload, render_cached
+from .scanning import FrameError, frame_from_data_url, frame_from_request
 
 def login_view(request):
     if request.method == "POST":
@@ -44,96 +52,268 @@ def signup_view(request):
     form = UserCreationForm()
     return render(request, "orders/signup.html", {"form": form})
 
+def _decode_report(result):
+    return {'attempt': result.attempt, 'timings_ms': {name: round(ms, 1) for name, ms in result.timings}}
+
+def _pool_unavailable(error, retry_after, stats):
+    response = JsonResponse({'error': error, 'retry_after': retry_after, 'queue': stats}, status=503)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+def _decode_frame(image):
+    """Return (qr_data, report, error_response); qr_data is None on failure."""
+    try:
+        result, queue = get_pool().decode(image)
+    except PoolBusy as e:
+        return None, None, _pool_unavailable('Scanner is busy, try again.', e.retry_after, e.stats)
+    except DecodeTimeout as e:
+        return None, None, _pool_unavailable('QR decode took too long.', getattr(settings, 'QR_DECODE_RETRY_AFTER', 1), e.stats)
+    report = {'decode': _decode_report(result), 'queue': queue}
+    if result.data is None:
+        return None, report, JsonResponse({'error': 'No QR code detected.', **report})
+    return result.data, report, None
+
+def _check_payload(qr_data, report):
+    """
+    Validate the card from the QR; return (item_id, error_response). The DB
+    is only read for a card whose printed end date has passed.
+    """
+    try:
+        payload = parse_payload(qr_data)
+    except InvalidPayload as e:
+        return None, JsonResponse({'error': str(e), **report}, status=400)
+    # التاريخ المطبوع انتهى: ربما جُدد الاشتراك ولم تُطبع البطاقة بعد
+    if payload.is_expired() and not Item_List.is_subscribed(payload.item_id):
+        return None, JsonResponse({
+            'error': 'Subscription expired',
+            'id': payload.item_id,
+            'subscription_end_date': payload.end_date,
+            **report,
+        }, status=403)
+    return payload.item_id, None
+
+def _qr_item_response(image):
+    qr_data, report, error = _decode_frame(image)
+    if error:
+        return error
+    item_id, error = _check_payload(qr_data, report)
+    if error:
+        return error
+    return JsonResponse({**get_item_data(item_id), **report})
+
 def scan_qr(request):
     if request.method == 'POST':
         image_data = request.POST.get('image', None)
         if image_data:
-            image_data = image_data.split(',')[1]
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(BytesIO(image_bytes))
-            image_np = np.array(image)
-            gray_image = np.dot(image_np[...,:3], [0.2989, 0.5870, 0.1140])
-            decoded_qrs = pyzbar.decode(gray_image.astype(np.uint8))
-
-            if decoded_qrs:
-                qr_data = decoded_qrs[0].data.decode('utf-8')
-                item_id = qr_data.split(',')[0].split(':')[-1].strip()
-                item = get_object_or_404(Item_List, id=item_id)
-                response_data = {
-                    'id': item.id,
-                    'name': item.name,
-                    'category': item.category.name,
-                    'subscription_start_date': item.subscription_start_date,
-                    'subscription_end_date': item.subscription_end_date,
-                    'image_url': item.image.url if item.image else None
-                }
-                return JsonResponse(response_data)
-            else:
-                return JsonResponse({'error': 'No QR code detected.'})
+            try:
+                image = frame_from_data_url(image_data)
+            except FrameError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            return _qr_item_response(image)
     elif request.method == 'GET':
         return render(request, 'scan_qr.html')
     return JsonResponse({'error': 'Invalid request'})
 
+def scan_qr_frame(request):
+    # نفس scan_qr لكن الصورة تصل كملف أو كـ body خام بدون base64
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'})
+    try:
+        image = frame_from_request(request)
+    except FrameError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return _qr_item_response(image)
+
+@login_required
+def scan_and_mark(request):
+    # فك QR (أو ID يدوي) + تسجيل الحضور/الانصراف في طلب واحد
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'})
+    direction = request.POST.get('direction') or request.GET.get('direction')
+    if direction not in Attendance.DIRECTIONS:
+        return JsonResponse({'error': 'Invalid direction'}, status=400)
+
+    item_id = request.POST.get('item_id') or request.GET.get('item_id')
+    report = {}
+    if not item_id:
+        try:
+            image = frame_from_request(request)
+        except FrameError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        qr_data, report, error = _decode_frame(image)
+        if error:
+            return error
+        item_id, error = _check_payload(qr_data, report)
+        if error:
+            return error
+    elif not item_id.isdigit():
+        return JsonResponse({'error': 'Invalid item ID'}, status=400)
+
+    try:
+        item_data = get_item_data(item_id)
+    except Http404:
+        return JsonResponse({'error': 'Item not found'}, status=404)
+    result = Attendance.mark_item(item_data, direction, state=True)
+    labels = dict(Attendance.ATTENDANCE_CHOICES)
+    return JsonResponse({
+        **item_data,
+        'direction': direction,
+        'attendance_status': labels[result.attendance_status],
+        'departure_status': labels[result.departure_status],
+        'already_marked': result.already_marked,
+        **report,
+    })
+
+@login_required
+def attendance_sync(request):
+    # دفعة علامات سجلها الماسح بدون اتصال: {"marks": [{"key", "direction", "marked_at", "item_id" أو "qr"}]}
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'})
+    try:
+        marks = json.loads(request.body)['marks']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not isinstance(marks, list):
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    limit = getattr(settings, 'ATTENDANCE_SYNC_BATCH', 500)
+    if len(marks) > limit:
+        return JsonResponse({'error': f'At most {limit} marks per request'}, status=413)
+    return JsonResponse({'results': SyncedMark.sync(marks)})
+
+@login_required
+@require_GET
+def roster(request):
+    """
+    Students changed since ``?since=<version>`` as compact JSON (see orders.roster).
+
+    The ETag is the version pair, so a device that is already current gets a 304.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return JsonResponse({'error': 'since must be an integer'}, status=400)
+    version = RosterChange.current_version()
+    # التاريخ جزء من الـ ETag لأن التحميل الكامل يستبعد الاشتراكات المنتهية
+    etag = f'"roster-{since}-{version}-{timezone.now().date()}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(roster_feed(since, version), json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def scan_qr_status(request):
+    return JsonResponse(get_pool().stats())
+
+ATTENDANCE_DIRECTIONS = {'حضور': 'arrival', 'انصراف': 'departure'}
+
 def attendance_view(request):
     if request.method == 'POST':
         attendance_data = request.POST.get('attendance_data', None)
-        attendance_status = request.POST.get('attendance_status', None)
+        direction = ATTENDANCE_DIRECTIONS.get(request.POST.get('attendance_status'))
 
-        if attendance_data:
+        if attendance_data and direction:
             try:
                 data = json.loads(attendance_data)
-                existing_record = Attendance.objects.filter(
-                    user_id=data['id'], attendance_date=date.today()
-                ).first()
-
-                if existing_record:
-                    if attendance_status == 'حضور':
-                        if existing_record.attendance_status == 'حضور':
-                            messages.error(request, f"{data['name']} has already been marked as present today!")
-                        else:
-                            existing_record.attendance_status = 'حضور'
-                            existing_record.save()
-                            messages.success(request, f"{data['name']} marked as present successfully!")
-                    elif attendance_status == 'انصراف':
-                        if existing_record.departure_status == 'انصراف':
-                            messages.error(request, f"{data['name']} has already been marked as departed today!")
-                        else:
-                            existing_record.departure_status = 'انصراف'
-                            existing_record.save()
-                            messages.success(request, f"{data['name']} marked as departed successfully!")
+                if Attendance.mark_item(data, direction, date.today()):
+                    messages.error(request, f"{data['name']} has already been marked as {'present' if direction == 'arrival' else 'departed'} today!")
                 else:
-                    Attendance.objects.create(
-                        user_id=data['id'],
-                        name=data['name'],
-                        category=data['category'],
-                        subscription_start_date=data['subscription_start_date'],
-                        subscription_end_date=data['subscription_end_date'],
-                        attendance_status='حضور' if attendance_status == 'حضور' else 'غياب',
-                        departure_status='انصراف' if attendance_status == 'انصراف' else 'غياب',
-                        attendance_date=date.today()
-                    )
-                    messages.success(request, f"{data['name']} Attendance ({attendance_status}) recorded successfully!")
+                    messages.success(request, f"{data['name']} marked as {'present' if direction == 'arrival' else 'departed'} successfully!")
             except Exception as e:
                 messages.error(request, f"Error: {e}")
-    
+
     return render(request, 'scan_qr.html')
 
+@staff_member_required
 def attendance_reset_view(request):
     today = timezone.now().date()
-    last_recorded_date = Attendance.objects.latest('attendance_date').attendance_date if Attendance.objects.exists() else None
-    
-    if not last_recorded_date or last_recorded_date < today:
-        for item in Item_List.objects.all():
-            Attendance.objects.create(
-                user_id=item.id,
-                name=item.name,
-                category=item.category.name,
-                subscription_start_date=item.subscription_start_date,
-                subscription_end_date=item.subscription_end_date,
-                attendance_status='غياب',
-                attendance_date=today
-            )
-    return render(request, 'attendance_page.html', {'attendance_list': Attendance.objects.filter(attendance_date=today)})
+    Attendance.ensure_roll(today)
+    roster = Attendance.roster(today).select_related('category').order_by('category__name', 'id')
+    return render(request, 'attendance_page.html', {'attendance_list': roster, 'day': today})
+
+@staff_member_required
+@require_GET
+def attendance_export(request):
+    """
+    Stream attendance as ``?format=csv|xlsx`` for ``from``..``to`` (YYYY-MM-DD,
+    default today), optionally narrowed by ``category`` and ``arrival``/``departure`` (1 or 0).
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'format must be csv or xlsx'}, status=400)
+    today = timezone.now().date()
+    try:
+        date_from = date.fromisoformat(request.GET.get('from') or today.isoformat())
+        date_to = date.fromisoformat(request.GET.get('to') or date_from.isoformat())
+    except ValueError:
+        return JsonResponse({'error': 'from/to must be YYYY-MM-DD'}, status=400)
+    if date_to < date_from:
+        return JsonResponse({'error': 'to is before from'}, status=400)
+    category = request.GET.get('category', '')
+    if category and not category.isdigit():
+        return JsonResponse({'error': 'category must be an ID'}, status=400)
+    flags = {'1': True, '0': False, '': None}
+    arrival, departure = request.GET.get('arrival', ''), request.GET.get('departure', '')
+    if arrival not in flags or departure not in flags:
+        return JsonResponse({'error': 'arrival/departure must be 1 or 0'}, status=400)
+    rows = roster_rows(date_from, date_to, category or None, flags[arrival], flags[departure])
+    return export_response(rows, export_format)
+
+QR_IMAGE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+QR_IMAGE_MAX_SIZE = 1024
+
+@staff_member_required
+@require_GET
+def qr_code_image(request, item_id):
+    """
+    The item's QR code rendered on request: ``?format=png|svg&size=<px>``.
+
+    The ETag is derived from the payload, so a browser only downloads the
+    image again when the card data changes. Links carrying ``v=<payload hash>``
+    (see ItemListAdmin.qr_code_tag) are cached as immutable.
+    """
+    image_format = request.GET.get('format', 'png')
+    if image_format not in QR_IMAGE_TYPES:
+        return JsonResponse({'error': 'format must be png or svg'}, status=400)
+    try:
+        size = min(max(int(request.GET.get('size', 150)), 1), QR_IMAGE_MAX_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'size must be an integer'}, status=400)
+
+    end_dates = Item_List.objects.filter(id=item_id).values_list('subscription_end_date', flat=True)
+    if not end_dates:
+        raise Http404('Item not found')
+    payload = encode_payload(item_id, end_dates[0])
+    payload_hash = hashlib.sha256(payload.encode()).hexdigest()
+    etag = '"%s"' % hashlib.sha256(f"{payload}:{image_format}:{size}".encode()).hexdigest()[:32]
+
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(render_cached(payload, image_format, size), content_type=QR_IMAGE_TYPES[image_format])
+    response['ETag'] = etag
+    if request.GET.get('v') and payload_hash.startswith(request.GET['v']):
+        patch_cache_control(response, private=True, max_age=31536000, immutable=True)
+    else:
+        # بدون v الرابط ثابت والمحتوى قد يتغير، فالمتصفح يتحقق بالـ ETag
+        patch_cache_control(response, private=True, max_age=300)
+    return response
+
+@staff_member_required
+@require_GET
+def qr_cards(request):
+    """Cards for ``?category=<id>`` (or every item) as ``?format=zip|png|pdf``."""
+    output = request.GET.get('format', 'pdf')
+    if output not in CARD_OUTPUTS:
+        return JsonResponse({'error': 'format must be zip, png or pdf'}, status=400)
+    items = Item_List.objects.all()
+    category = request.GET.get('category', '')
+    if category:
+        if not category.isdigit():
+            return JsonResponse({'error': 'category must be an ID'}, status=400)
+        items = items.filter(category_id=category)
+    return cards_response(items, output)
 
 def scan_qr_by_id(request):
     today = timezone.now().date()
@@ -141,16 +321,7 @@ def scan_qr_by_id(request):
         item_id = request.POST.get('item_id', None)
         if item_id:
             try:
-                item = get_object_or_404(Item_List, id=item_id)
-                response_data = {
-                    'id': item.id,
-                    'name': item.name,
-                    'category': item.category.name,
-                    'subscription_start_date': item.subscription_start_date,
-                    'subscription_end_date': item.subscription_end_date,
-                    'image_url': item.image.url if item.image else None
-                }
-                return JsonResponse(response_data)
+                return JsonResponse(get_item_data(item_id))
             except Exception as e:
                 return JsonResponse({'error': 'Item not found'})
         else:
@@ -98,6 +98,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {'timeout': 20},
+        # قاعدة اختبار في ملف (وليس في الذاكرة) حتى تفتح اختبارات الـ threads اتصالات مستقلة
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
@@ -120,6 +123,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# login_required (roster، scan_and_mark، attendance/sync) يحول إلى صفحة الدخول في orders.urls
+LOGIN_URL = 'login'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.0/topics/i18n/
@@ -142,3 +148,53 @@ STATIC_URL = '/static/'
 
 # إضافة الإعدادات الخاصة بالتخزين الثابت والوسائط في بيئة الإنتاج
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# ترتيب محاولات قراءة QR في orders.scanning.DecodeStrategy (الأرخص أولاً)
+QR_DECODE_ATTEMPTS = ('downscaled', 'center', 'full')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # 'DEBUG' يطبع توقيت كل محاولة قراءة QR (سطر لكل إطار) لضبط ترتيب المحاولات من بيانات حقيقية
+        'orders': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
+# عمليات فك QR (0 = داخل نفس thread الطلب)
+QR_DECODE_WORKERS = 2
+# عدد الإطارات المسموح بانتظارها عندما يكون كل العمال مشغولين، بعدها يرد الخادم 503
+QR_DECODE_QUEUE_SIZE = 8
+# أقصى زمن بالثواني لكل إطار
+QR_DECODE_TIMEOUT = 2.0
+QR_DECODE_RETRY_AFTER = 1
+
+# كاش بيانات الطالب المستخدمة في المسح (orders.item_cache)
+# لمشاركته بين عدة عمليات: 'orders.item_cache.DjangoCacheBackend' مع {'alias': 'default'}
+ITEM_CACHE = {
+    'BACKEND': 'orders.item_cache.LRUBackend',
+    'OPTIONS': {'max_entries': 4096},
+}
+
+# True: رسم صور QR في الخلفية عبر "python manage.py run_jobs" بدل داخل طلب حفظ الأدمن
+# يحتاج run_jobs يعمل تحت مشرف يعيد تشغيله (systemd أو خدمة docker-compose بـ restart)
+QR_RENDER_ASYNC = False
+JOB_MAX_ATTEMPTS = 5
+
+# False: لا نحفظ ملفات PNG للـ QR، والصور تُرسم عند الطلب من /qr/<id>/
+QR_STORE_FILES = True
+
+# خط TTF لأسماء الطلاب في كروت الطباعة (يجب أن يدعم العربية)؛ None = orders/fonts/DejaVuSans.ttf
+QR_CARD_FONT = None
+
+# True: نسجل الحضور/الانصراف فقط ولا ننشئ صفوف غياب يومية؛ الغياب يُحسب من الاشتراكات (Attendance.roster)
+ATTENDANCE_SPARSE = False
+
+# عدد الأشهر التي تبقى في جدول الحضور؛ الأقدم منها ينقله archive_attendance إلى AttendanceArchive
+ATTENDANCE_HOT_MONTHS = 4
+
+# أقصى عدد علامات في طلب مزامنة واحد من الماسح (attendance/sync/)
+ATTENDANCE_SYNC_BATCH = 500